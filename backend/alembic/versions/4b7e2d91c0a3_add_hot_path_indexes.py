@@ -0,0 +1,47 @@
+"""add hot path indexes
+
+Revision ID: 4b7e2d91c0a3
+Revises: c7efcf8b22e1
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e2d91c0a3'
+down_revision: Union[str, Sequence[str], None] = 'c7efcf8b22e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY no puede ir dentro de una transacción y evita bloquear las escrituras
+    with op.get_context().autocommit_block():
+        # listar_retos / listar_retos_por_materia: retos activos de un tenant, opcionalmente por materia
+        op.create_index('ix_retos_tenant_materia_activos', 'retos', ['tenant_id', 'materia'],
+                        postgresql_where=sa.text("activo = 'true'"), postgresql_concurrently=True, if_not_exists=True)
+        # mis_retos: retos activos de un profesor
+        op.create_index('ix_retos_profesor_activos', 'retos', ['profesor_id'],
+                        postgresql_where=sa.text("activo = 'true'"), postgresql_concurrently=True, if_not_exists=True)
+        # completar_reto y obtener_mi_progreso
+        op.create_index('ix_progreso_retos_estudiante_reto', 'progreso_retos', ['estudiante_id', 'reto_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        # obtener_ranking: usuarios activos de un tenant/grado ordenados por puntos. El rol no entra
+        # en el predicado: las etiquetas de rolenum son los nombres o los valores del enum según
+        # si la tabla la creó create_all o la migración inicial.
+        op.create_index('ix_usuarios_ranking', 'usuarios', ['tenant_id', 'grado', 'puntos_totales'],
+                        postgresql_where=sa.text("activo = 'true'"), postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_usuarios_ranking', table_name='usuarios', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_progreso_retos_estudiante_reto', table_name='progreso_retos', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_retos_profesor_activos', table_name='retos', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_retos_tenant_materia_activos', table_name='retos', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,124 @@
+"""merge estudiantes into usuarios and replace the table with a view
+
+Revision ID: 5f1c0d7e2b94
+Revises: e3b8f25a9c60
+Create Date: 2026-10-18 16:00:00.000000
+
+Los estudiantes que solo existían en la tabla estudiantes (alta desde POST /estudiantes/)
+pasan a usuarios con la contraseña hasheada. La tabla original se conserva como
+estudiantes_legacy, sin la columna de contraseña en texto plano, y estudiantes pasa a
+ser una vista de solo lectura sobre usuarios para los informes que la consulten.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+from passlib.context import CryptContext
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f1c0d7e2b94'
+down_revision: Union[str, Sequence[str], None] = 'e3b8f25a9c60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DOMINIO_EMAIL_ESTUDIANTES = "estudiante.colegio.edu"
+ALTERNATIVAS_EMAIL = 9
+
+# rolenum guarda nombres (create_all) o valores (migración inicial) según cómo se creó la base
+VISTA_ESTUDIANTES = """
+    CREATE VIEW estudiantes AS
+    SELECT id, dni, nombre, apellido, fecha_nacimiento, edad, grado, seccion, sexo,
+           email AS correo, tenant_id
+    FROM usuarios
+    WHERE rol::text IN ('estudiante', 'ESTUDIANTE')
+"""
+
+
+def _etiqueta_estudiante(bind) -> str:
+    etiquetas = bind.execute(sa.text("SELECT unnest(enum_range(NULL::rolenum))::text")).scalars().all()
+    return 'estudiante' if 'estudiante' in etiquetas else 'ESTUDIANTE'
+
+
+def _fusionar(bind) -> None:
+    """Copia a usuarios los estudiantes cuyo DNI aún no está allí"""
+    filas = bind.execute(sa.text("""
+        SELECT e.* FROM estudiantes e
+        WHERE NOT EXISTS (SELECT 1 FROM usuarios u WHERE u.dni = e.dni)
+        ORDER BY e.id
+    """)).mappings().all()
+    if not filas:
+        return
+
+    dnis = [fila['dni'] for fila in filas]
+    usernames_ocupados = set(bind.execute(
+        sa.text("SELECT username FROM usuarios WHERE username = ANY(:dnis)"), {'dnis': dnis}
+    ).scalars().all())
+    candidatos = {
+        fila['id']: [fila['correo'], f"{fila['dni']}@{DOMINIO_EMAIL_ESTUDIANTES}"]
+        + [f"{fila['dni']}_{n}@{DOMINIO_EMAIL_ESTUDIANTES}" for n in range(1, ALTERNATIVAS_EMAIL + 1)]
+        for fila in filas
+    }
+    emails_ocupados = set(bind.execute(
+        sa.text("SELECT email FROM usuarios WHERE email = ANY(:emails)"),
+        {'emails': [email for lista in candidatos.values() for email in lista if email]}
+    ).scalars().all())
+
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    rol = _etiqueta_estudiante(bind)
+    nuevos = []
+    for fila in filas:
+        if fila['dni'] in usernames_ocupados:
+            print(f"  estudiantes.id={fila['id']}: el username {fila['dni']} ya existe, queda en estudiantes_legacy")
+            continue
+        email = next((e for e in candidatos[fila['id']] if e and e not in emails_ocupados), None)
+        if email is None:
+            print(f"  estudiantes.id={fila['id']}: sin email libre, queda en estudiantes_legacy")
+            continue
+        usernames_ocupados.add(fila['dni'])
+        emails_ocupados.add(email)
+        nuevos.append({
+            'username': fila['dni'],
+            'email': email,
+            'password_hash': pwd_context.hash(fila['password']),
+            'rol': rol,
+            'nombre': fila['nombre'],
+            'apellido': fila['apellido'],
+            'dni': fila['dni'],
+            'fecha_nacimiento': fila['fecha_nacimiento'],
+            'edad': fila['edad'],
+            'grado': fila['grado'],
+            'seccion': fila['seccion'],
+            'sexo': fila['sexo'],
+            'tenant_id': fila['tenant_id'],
+        })
+    if nuevos:
+        bind.execute(sa.text("""
+            INSERT INTO usuarios (username, email, password_hash, rol, nombre, apellido, dni,
+                                  fecha_nacimiento, edad, grado, seccion, sexo, tenant_id,
+                                  puntos_matematicas, puntos_comunicacion, puntos_personal_social,
+                                  puntos_ciencia_tecnologia, puntos_ingles, puntos_totales, activo)
+            VALUES (:username, :email, :password_hash, CAST(:rol AS rolenum), :nombre, :apellido, :dni,
+                    :fecha_nacimiento, :edad, :grado, :seccion, :sexo, :tenant_id,
+                    0, 0, 0, 0, 0, 0, true)
+        """), nuevos)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if context.is_offline_mode():
+        raise RuntimeError("Esta migración hashea contraseñas en Python; ejecútala en modo online")
+    bind = op.get_bind()
+    _fusionar(bind)
+    op.rename_table('estudiantes', 'estudiantes_legacy')
+    op.drop_column('estudiantes_legacy', 'password')
+    op.execute(VISTA_ESTUDIANTES)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Los estudiantes fusionados se quedan en usuarios; la tabla vuelve sin las contraseñas
+    op.execute("DROP VIEW IF EXISTS estudiantes")
+    op.rename_table('estudiantes_legacy', 'estudiantes')
+    op.add_column('estudiantes', sa.Column('password', sa.String(), nullable=False, server_default=''))
+    op.alter_column('estudiantes', 'password', server_default=None)
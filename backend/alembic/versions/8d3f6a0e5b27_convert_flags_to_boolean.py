@@ -0,0 +1,106 @@
+"""convert activo/completado flags to boolean
+
+Revision ID: 8d3f6a0e5b27
+Revises: 4b7e2d91c0a3
+Create Date: 2026-10-18 13:10:00.000000
+
+Migración en línea: se crea una columna booleana paralela que un trigger mantiene
+sincronizada mientras se rellena por lotes; al final se intercambian las columnas en
+una transacción corta. Los índices parciales se recrean sobre la columna booleana.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f6a0e5b27'
+down_revision: Union[str, Sequence[str], None] = '4b7e2d91c0a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (tabla, columna, valor por defecto)
+COLUMNAS = [
+    ('usuarios', 'activo', 'true'),
+    ('retos', 'activo', 'true'),
+    ('progreso_retos', 'completado', 'false'),
+]
+TAMANO_LOTE = 5000
+
+
+def _rellenar_por_lotes(tabla: str, columna: str) -> None:
+    """Copia el valor de texto a la columna booleana en lotes cortos para no bloquear la tabla"""
+    sql = (f"UPDATE {tabla} SET {columna}_bool = ({columna} = 'true') "
+           f"WHERE id IN (SELECT id FROM {tabla} WHERE {columna}_bool IS NULL LIMIT {TAMANO_LOTE})")
+    if context.is_offline_mode():
+        op.execute(sql)
+        return
+    bind = op.get_bind()
+    while bind.execute(sa.text(sql)).rowcount:
+        pass
+
+
+def _crear_indices_parciales(condicion_activo: str) -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_retos_tenant_materia_activos', 'retos', ['tenant_id', 'materia'],
+                        postgresql_where=sa.text(condicion_activo), postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_retos_profesor_activos', 'retos', ['profesor_id'],
+                        postgresql_where=sa.text(condicion_activo), postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_usuarios_ranking', 'usuarios', ['tenant_id', 'grado', 'puntos_totales'],
+                        postgresql_where=sa.text(condicion_activo),
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 1. Columna booleana paralela + trigger que la mantiene al día con las escrituras de la versión anterior
+    for tabla, columna, _ in COLUMNAS:
+        op.add_column(tabla, sa.Column(f'{columna}_bool', sa.Boolean(), nullable=True))
+        op.execute(f"""
+            CREATE FUNCTION {tabla}_{columna}_bool_sync() RETURNS trigger AS $$
+            BEGIN
+                NEW.{columna}_bool := (NEW.{columna} = 'true');
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {tabla}_{columna}_bool_sync BEFORE INSERT OR UPDATE ON {tabla}
+            FOR EACH ROW EXECUTE FUNCTION {tabla}_{columna}_bool_sync()
+        """)
+        op.execute(f"ALTER TABLE {tabla} ADD CONSTRAINT {tabla}_{columna}_bool_not_null "
+                   f"CHECK ({columna}_bool IS NOT NULL) NOT VALID")
+
+    # 2. Relleno por lotes y validación del CHECK fuera de cualquier transacción larga
+    with op.get_context().autocommit_block():
+        for tabla, columna, _ in COLUMNAS:
+            _rellenar_por_lotes(tabla, columna)
+            op.execute(f"ALTER TABLE {tabla} VALIDATE CONSTRAINT {tabla}_{columna}_bool_not_null")
+
+    # 3. Intercambio de columnas (rápido: SET NOT NULL aprovecha el CHECK ya validado).
+    #    Al borrar la columna de texto se eliminan también sus índices parciales.
+    for tabla, columna, defecto in COLUMNAS:
+        op.execute(f"DROP TRIGGER {tabla}_{columna}_bool_sync ON {tabla}")
+        op.execute(f"DROP FUNCTION {tabla}_{columna}_bool_sync()")
+        op.drop_column(tabla, columna)
+        op.alter_column(tabla, f'{columna}_bool', new_column_name=columna,
+                        nullable=False, server_default=sa.text(defecto))
+        op.drop_constraint(f'{tabla}_{columna}_bool_not_null', tabla, type_='check')
+
+    # 4. Índices parciales sobre la columna booleana
+    _crear_indices_parciales("activo")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Los predicados booleanos de los índices no serían válidos sobre texto
+    op.drop_index('ix_usuarios_ranking', table_name='usuarios')
+    op.drop_index('ix_retos_profesor_activos', table_name='retos')
+    op.drop_index('ix_retos_tenant_materia_activos', table_name='retos')
+    for tabla, columna, defecto in COLUMNAS:
+        op.alter_column(tabla, columna, server_default=None)
+        op.alter_column(tabla, columna, type_=sa.String(),
+                        postgresql_using=f"CASE WHEN {columna} THEN 'true' ELSE 'false' END")
+        op.alter_column(tabla, columna, server_default=defecto)
+    _crear_indices_parciales("activo = 'true'")
@@ -0,0 +1,45 @@
+"""unique progreso per estudiante and reto
+
+Revision ID: a52c9e7f1d84
+Revises: 8d3f6a0e5b27
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a52c9e7f1d84'
+down_revision: Union[str, Sequence[str], None] = '8d3f6a0e5b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Eliminar duplicados: se conserva la fila completada (o la más antigua) de cada par
+    op.execute("""
+        DELETE FROM progreso_retos p
+        USING (
+            SELECT id, row_number() OVER (
+                PARTITION BY estudiante_id, reto_id ORDER BY completado DESC, id
+            ) AS n
+            FROM progreso_retos
+        ) d
+        WHERE p.id = d.id AND d.n > 1
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index('uq_progreso_retos_estudiante_reto', 'progreso_retos', ['estudiante_id', 'reto_id'],
+                        unique=True, postgresql_concurrently=True, if_not_exists=True)
+    op.execute("ALTER TABLE progreso_retos ADD CONSTRAINT uq_progreso_retos_estudiante_reto "
+               "UNIQUE USING INDEX uq_progreso_retos_estudiante_reto")
+    # El índice único ya cubre (estudiante_id, reto_id)
+    op.drop_index('ix_progreso_retos_estudiante_reto', table_name='progreso_retos', if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_progreso_retos_estudiante_reto', 'progreso_retos', ['estudiante_id', 'reto_id'])
+    op.drop_constraint('uq_progreso_retos_estudiante_reto', 'progreso_retos', type_='unique')
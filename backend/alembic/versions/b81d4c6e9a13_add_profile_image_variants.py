@@ -0,0 +1,32 @@
+"""add profile image variant urls to usuarios
+
+Revision ID: b81d4c6e9a13
+Revises: 5f1c0d7e2b94
+Create Date: 2026-10-18 17:00:00.000000
+
+URLs de las variantes reducidas (avatar y medium) que se generan en segundo plano al
+subir una foto de perfil. Las fotos ya subidas siguen sirviéndose en tamaño original.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81d4c6e9a13'
+down_revision: Union[str, Sequence[str], None] = '5f1c0d7e2b94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('usuarios', sa.Column('profile_image_avatar_url', sa.String(), nullable=True))
+    op.add_column('usuarios', sa.Column('profile_image_medium_url', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('usuarios', 'profile_image_medium_url')
+    op.drop_column('usuarios', 'profile_image_avatar_url')
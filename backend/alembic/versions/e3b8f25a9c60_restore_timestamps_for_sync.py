@@ -0,0 +1,57 @@
+"""restore created_at/updated_at on retos and progreso_retos for delta sync
+
+Revision ID: e3b8f25a9c60
+Revises: a52c9e7f1d84
+Create Date: 2026-10-18 15:00:00.000000
+
+Las bases creadas con las migraciones ya tienen las columnas (nulas y sin valor por
+defecto); las creadas con create_all no. En ambos casos se termina con columnas NOT NULL
+con DEFAULT now() y los índices que usa /sync.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b8f25a9c60'
+down_revision: Union[str, Sequence[str], None] = 'a52c9e7f1d84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (tabla, valor para rellenar las filas antiguas)
+TABLAS = [
+    ('retos', 'now()'),
+    ('progreso_retos', 'coalesce(fecha_completado, now())'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for tabla, relleno in TABLAS:
+        # Con DEFAULT no volátil PostgreSQL añade la columna sin reescribir la tabla
+        op.execute(f"ALTER TABLE {tabla} "
+                   f"ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+                   f"ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()")
+        # Si ya existían pueden tener nulos
+        op.execute(f"UPDATE {tabla} SET created_at = coalesce(created_at, {relleno}), "
+                   f"updated_at = coalesce(updated_at, created_at, {relleno}) "
+                   f"WHERE created_at IS NULL OR updated_at IS NULL")
+        op.execute(f"ALTER TABLE {tabla} "
+                   f"ALTER COLUMN created_at SET DEFAULT now(), ALTER COLUMN created_at SET NOT NULL, "
+                   f"ALTER COLUMN updated_at SET DEFAULT now(), ALTER COLUMN updated_at SET NOT NULL")
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_retos_tenant_updated_at', 'retos', ['tenant_id', 'updated_at'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_progreso_retos_estudiante_updated_at', 'progreso_retos', ['estudiante_id', 'updated_at'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_progreso_retos_estudiante_updated_at', table_name='progreso_retos', if_exists=True)
+    op.drop_index('ix_retos_tenant_updated_at', table_name='retos', if_exists=True)
+    for tabla, _ in TABLAS:
+        op.drop_column(tabla, 'updated_at')
+        op.drop_column(tabla, 'created_at')
@@ -0,0 +1,104 @@
+from typing import Optional, Set
+import asyncio
+import os
+import time
+from sqlalchemy import text
+from app.database import engine
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+# Presupuesto de arranque (importación + lifespan); si se supera se avisa en el log
+ARRANQUE_PRESUPUESTO_S = float(os.getenv("ARRANQUE_PRESUPUESTO_S", "2"))
+# Segundos antes de volver a comprobar un esquema que no estaba listo
+ESQUEMA_REINTENTO_S = float(os.getenv("ESQUEMA_REINTENTO_S", "5"))
+
+def revisiones_esperadas() -> Set[str]:
+    """Heads de Alembic según los archivos de migración desplegados con el código"""
+    # Import diferido: alembic solo se carga en la comprobación, fuera del camino de arranque
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+    return set(ScriptDirectory.from_config(Config(ALEMBIC_INI)).get_heads())
+
+class Arranque:
+    """
+    Tiempos de arranque del proceso y comprobación de que el esquema de la base está en la
+    revisión de Alembic del código. El esquema ya no se crea al arrancar: se aplica antes con
+    `alembic upgrade head` (o create_tables.py en desarrollo).
+    """
+
+    def __init__(self):
+        self.inicio: Optional[float] = None
+        self.importacion_s: Optional[float] = None
+        self.lifespan_s: Optional[float] = None
+        self.primera_peticion_s: Optional[float] = None
+        self._comprobacion: Optional[asyncio.Task] = None
+        self._comprobado_en = 0.0
+
+    def importacion_terminada(self, inicio: float) -> None:
+        self.inicio = inicio
+        self.importacion_s = time.perf_counter() - inicio
+
+    def listo_para_servir(self, inicio_lifespan: float) -> None:
+        self.lifespan_s = time.perf_counter() - inicio_lifespan
+        total = (self.importacion_s or 0) + self.lifespan_s
+        aviso = f" (supera el presupuesto de {ARRANQUE_PRESUPUESTO_S:g} s)" if total > ARRANQUE_PRESUPUESTO_S else ""
+        print(f"Arranque: importación {self.importacion_s * 1000:.0f} ms, "
+              f"lifespan {self.lifespan_s * 1000:.0f} ms{aviso}")
+
+    def primera_respuesta(self) -> None:
+        if self.primera_peticion_s is None and self.inicio is not None:
+            self.primera_peticion_s = time.perf_counter() - self.inicio
+
+    def comprobar_esquema(self) -> None:
+        """Lanza la comprobación en segundo plano, sin retrasar el arranque"""
+        self._comprobacion = asyncio.get_running_loop().create_task(self._comprobar())
+        self._comprobado_en = time.monotonic()
+
+    async def _comprobar(self) -> dict:
+        try:
+            esperadas = await asyncio.to_thread(revisiones_esperadas)
+            async with engine.connect() as conn:
+                actuales = set((await conn.execute(text("SELECT version_num FROM alembic_version"))).scalars())
+        except Exception as e:
+            return {"listo": False, "error": f"No se pudo comprobar la versión del esquema: {e}"}
+        resultado = {"listo": actuales == esperadas, "revision": sorted(actuales), "esperada": sorted(esperadas)}
+        if not resultado["listo"]:
+            resultado["error"] = "El esquema no está en la última migración; ejecuta `alembic upgrade head`"
+            print(f"[arranque] {resultado['error']} (base: {resultado['revision']}, código: {resultado['esperada']})")
+        return resultado
+
+    async def estado_esquema(self) -> dict:
+        """Resultado de la comprobación; si no estaba listo se repite como mucho cada ESQUEMA_REINTENTO_S"""
+        if self._comprobacion is None:
+            self.comprobar_esquema()
+        elif self._comprobacion.done() and not self._comprobacion.result()["listo"] \
+                and time.monotonic() - self._comprobado_en >= ESQUEMA_REINTENTO_S:
+            self.comprobar_esquema()
+        return await asyncio.shield(self._comprobacion)
+
+    def tiempos(self) -> dict:
+        redondear = lambda s: round(s * 1000, 1) if s is not None else None
+        return {
+            "importacion_ms": redondear(self.importacion_s),
+            "lifespan_ms": redondear(self.lifespan_s),
+            "primera_respuesta_ms": redondear(self.primera_peticion_s),
+            "presupuesto_ms": ARRANQUE_PRESUPUESTO_S * 1000,
+        }
+
+arranque = Arranque()
+
+class MedirPrimeraRespuesta:
+    """Middleware ASGI que anota cuándo sale la primera respuesta HTTP desde el inicio del proceso"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or arranque.primera_peticion_s is not None:
+            return await self.app(scope, receive, send)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                arranque.primera_respuesta()
+            await send(mensaje)
+
+        await self.app(scope, receive, enviar)
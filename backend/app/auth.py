@@ -1,28 +1,102 @@
 from passlib.context import CryptContext
+from passlib.hash import bcrypt
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.database import get_db
+from sqlalchemy import select, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db, SessionLocal
 from app.models.usuario import Usuario, RolEnum
+from app.utils.cache import CacheLRU
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+import asyncio
 import os
+import time
 
 # Configuración de seguridad
 SECRET_KEY = os.getenv("SECRET_KEY", "tu_clave_secreta_super_segura_cambiame")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 horas
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Cache de principales autenticados (por proceso). El TTL acota cuánto tarda en verse
+# un cambio de rol o una desactivación hecha desde otro worker.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# Coste de bcrypt. Los hashes con otro coste se regeneran de forma transparente en el login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Máximo de hashes bcrypt ejecutándose a la vez; el resto espera en cola sin bloquear el event loop
+HASH_CONCURRENCIA = int(os.getenv("HASH_CONCURRENCIA", str(min(4, os.cpu_count() or 1))))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 security = HTTPBearer()
 
-def hash_password(password: str) -> str:
-    """Hashea una contraseña"""
-    return pwd_context.hash(password)
+@dataclass(frozen=True)
+class Principal:
+    """Vista inmutable y reducida del usuario autenticado"""
+    id: int
+    username: str
+    rol: RolEnum
+    tenant_id: str
+    activo: bool
+
+_principales = CacheLRU(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+def invalidar_principal(username: str) -> None:
+    """Elimina del cache el principal de un usuario (p. ej. al desactivarlo o cambiar su rol)"""
+    _principales.pop(username)
+
+# bcrypt libera el GIL, así que un pool de hilos dedicado basta para sacarlo del event loop
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_CONCURRENCIA, thread_name_prefix="bcrypt")
+_hash_limite = asyncio.Semaphore(HASH_CONCURRENCIA)
+_hash_stats = {"en_cola": 0, "en_curso": 0, "completados": 0, "espera_total": 0.0, "espera_max": 0.0}
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verifica una contraseña contra su hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+async def _en_pool_hash(funcion, *args):
+    """Ejecuta una operación de bcrypt en el pool dedicado respetando el límite de concurrencia"""
+    _hash_stats["en_cola"] += 1
+    inicio = time.perf_counter()
+    async with _hash_limite:
+        espera = time.perf_counter() - inicio
+        _hash_stats["en_cola"] -= 1
+        _hash_stats["en_curso"] += 1
+        _hash_stats["espera_total"] += espera
+        _hash_stats["espera_max"] = max(_hash_stats["espera_max"], espera)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(_hash_executor, funcion, *args)
+        finally:
+            _hash_stats["en_curso"] -= 1
+            _hash_stats["completados"] += 1
+
+def estadisticas_hash() -> dict:
+    """Profundidad de cola y tiempos de espera del pool de bcrypt"""
+    completados = _hash_stats["completados"]
+    return {
+        "concurrencia": HASH_CONCURRENCIA,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "en_cola": _hash_stats["en_cola"],
+        "en_curso": _hash_stats["en_curso"],
+        "completados": completados,
+        "espera_media_ms": round(_hash_stats["espera_total"] / completados * 1000, 3) if completados else 0.0,
+        "espera_max_ms": round(_hash_stats["espera_max"] * 1000, 3),
+    }
+
+async def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    """
+    Hashea una contraseña. Con `rounds` menor que BCRYPT_ROUNDS el hash se marca como
+    obsoleto y authenticate_user lo rehace con el coste normal en el primer login.
+    """
+    if rounds is None or rounds == BCRYPT_ROUNDS:
+        return await _en_pool_hash(pwd_context.hash, password)
+    return await _en_pool_hash(bcrypt.using(rounds=rounds).hash, password)
 
 def create_access_token(data: dict):
     """Crea un token JWT"""
@@ -32,17 +106,39 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(db: Session, username: str, password: str):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
     """Autentica un usuario"""
-    user = db.query(Usuario).filter(Usuario.username == username).first()
+    result = await db.execute(select(Usuario).where(Usuario.username == username))
+    user = result.scalars().first()
     if not user:
         return False
-    if not verify_password(password, user.password_hash):
+    valido, nuevo_hash = await _en_pool_hash(pwd_context.verify_and_update, password, user.password_hash)
+    if not valido:
         return False
+    if nuevo_hash:
+        # El hash se generó con otro coste de bcrypt: se reemplaza aprovechando el login
+        user.password_hash = nuevo_hash
+        await db.commit()
     return user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
-    """Obtiene el usuario actual desde el token JWT"""
+def _invalidar_si_cambia_acceso(mapper, connection, target):
+    """Descarta el principal cacheado cuando cambia el rol, el estado o el username"""
+    estado = inspect(target)
+    for campo in ("rol", "activo", "username"):
+        historial = estado.attrs[campo].history
+        if historial.has_changes():
+            for username in (*historial.deleted, target.username):
+                invalidar_principal(username)
+            return
+
+def _invalidar_al_borrar(mapper, connection, target):
+    invalidar_principal(target.username)
+
+event.listen(Usuario, "after_update", _invalidar_si_cambia_acceso)
+event.listen(Usuario, "after_delete", _invalidar_al_borrar)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_db)):
+    """Obtiene el usuario actual desde el token JWT (usando el cache de principales)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
@@ -51,90 +147,73 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            print("[DEBUG] Token sin username válido")
-            raise credentials_exception
-            
-        print(f"[DEBUG] Buscando usuario: {username}")
-        
     except JWTError as e:
         print(f"[ERROR] Error al decodificar JWT: {e}")
         raise credentials_exception
-    except Exception as e:
-        print(f"[ERROR] Error inesperado en auth: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error interno de autenticación: {str(e)}"
-        )
+    
+    username = payload.get("sub")
+    if username is None:
+        raise credentials_exception
     
     try:
-        user = db.query(Usuario).filter(Usuario.username == username).first()
-        if user is None:
-            print(f"[DEBUG] Usuario no encontrado: {username}")
-            raise credentials_exception
-            
-        print(f"[DEBUG] Usuario encontrado: {user.id} - {user.username}")
-        return user
-        
+        principal = await _cargar_principal(db, username)
     except Exception as e:
         print(f"[ERROR] Error al buscar usuario en BD: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Error al consultar base de datos: {str(e)}"
         )
+    
+    if principal is None:
+        raise credentials_exception
+    return principal
 
-async def get_current_active_user(current_user: Usuario = Depends(get_current_user)):
-    """Obtiene el usuario actual activo"""
+async def _cargar_principal(db: AsyncSession, username: str) -> Optional[Principal]:
+    """Principal de un username, desde el cache o la BD; None si no existe"""
+    principal = _principales.get(username)
+    if principal is not None:
+        return principal
+    result = await db.execute(
+        select(Usuario.id, Usuario.username, Usuario.rol, Usuario.tenant_id, Usuario.activo)
+        .where(Usuario.username == username)
+    )
+    fila = result.first()
+    if fila is None:
+        return None
+    principal = Principal(**fila._mapping)
+    _principales.set(username, principal)
+    return principal
+
+async def admin_desde_token(token: str) -> Optional[Principal]:
+    """Administrador activo dueño del token, o None; para usar fuera de las dependencias de FastAPI"""
     try:
-        print(f"[DEBUG] Verificando usuario activo: {current_user.username}")
-        
-        # Verificar si el usuario tiene el campo activo
-        if not hasattr(current_user, 'activo'):
-            print("[DEBUG] Usuario sin campo 'activo', asumiendo activo")
-            return current_user
-            
-        if current_user.activo != "true":
-            print(f"[DEBUG] Usuario inactivo: {current_user.activo}")
-            raise HTTPException(status_code=400, detail="Usuario inactivo")
-            
-        print(f"[DEBUG] Usuario activo confirmado")
-        return current_user
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"[ERROR] Error verificando usuario activo: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error al verificar estado del usuario: {str(e)}"
-        )
+        username = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+    if username is None:
+        return None
+    async with SessionLocal() as db:
+        principal = await _cargar_principal(db, username)
+    if principal is None or not principal.activo or principal.rol != RolEnum.ADMIN:
+        return None
+    return principal
 
-async def get_current_profesor(current_user: Usuario = Depends(get_current_active_user)):
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)):
+    """Obtiene el usuario actual activo"""
+    if not current_user.activo:
+        raise HTTPException(status_code=400, detail="Usuario inactivo")
+    return current_user
+
+async def get_current_profesor(current_user: Principal = Depends(get_current_active_user)):
     """Verifica que el usuario actual sea profesor o admin"""
-    try:
-        print(f"[DEBUG] Verificando permisos de profesor para: {current_user.username} (rol: {current_user.rol})")
-        
-        if current_user.rol not in [RolEnum.PROFESOR, RolEnum.ADMIN]:
-            print(f"[DEBUG] Usuario sin permisos de profesor: {current_user.rol}")
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="No tienes permisos de profesor"
-            )
-            
-        print(f"[DEBUG] Permisos de profesor confirmados")
-        return current_user
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"[ERROR] Error verificando permisos de profesor: {e}")
+    if current_user.rol not in [RolEnum.PROFESOR, RolEnum.ADMIN]:
         raise HTTPException(
-            status_code=500,
-            detail=f"Error al verificar permisos: {str(e)}"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos de profesor"
         )
+    return current_user
 
-async def get_current_estudiante(current_user: Usuario = Depends(get_current_active_user)):
+async def get_current_estudiante(current_user: Principal = Depends(get_current_active_user)):
     """Verifica que el usuario actual sea estudiante"""
     if current_user.rol != RolEnum.ESTUDIANTE:
         raise HTTPException(
@@ -142,3 +221,12 @@ async def get_current_estudiante(current_user: Usuario = Depends(get_current_act
             detail="No tienes permisos de estudiante"
         )
     return current_user
+
+async def get_current_admin(current_user: Principal = Depends(get_current_active_user)):
+    """Verifica que el usuario actual sea administrador"""
+    if current_user.rol != RolEnum.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tienes permisos de administrador"
+        )
+    return current_user
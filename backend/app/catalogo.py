@@ -0,0 +1,39 @@
+from typing import Awaitable, Callable, Optional
+import os
+from app.utils.cache import CacheLRU, CargaUnica
+
+# Entradas (tenant, materia) guardadas y segundos que vive cada una. El TTL acota el
+# desfase entre workers: las invalidaciones solo llegan al proceso que hizo la escritura.
+RETOS_CACHE_SIZE = int(os.getenv("RETOS_CACHE_SIZE", "1000"))
+RETOS_CACHE_TTL = float(os.getenv("RETOS_CACHE_TTL", "300"))
+
+def _materia(materia) -> Optional[str]:
+    return getattr(materia, "value", materia)
+
+class CatalogoRetos:
+    """
+    Respuestas ya serializadas del catálogo de retos activos por (tenant_id, materia).
+    materia=None es el listado completo del tenant. Se invalida desde los handlers que
+    crean, modifican o eliminan retos.
+    """
+
+    def __init__(self):
+        self._cache = CacheLRU(maxsize=RETOS_CACHE_SIZE, ttl=RETOS_CACHE_TTL)
+        # Un solo lector consulta la BD aunque toda la clase refresque la pantalla a la vez;
+        # una carga que empezó antes de una invalidación del tenant no guarda su resultado
+        self._cargas = CargaUnica(self._cache)
+
+    async def obtener(self, tenant_id: str, materia, cargar: Callable[[], Awaitable[bytes]]) -> bytes:
+        return await self._cargas.obtener((tenant_id, _materia(materia)), tenant_id, cargar)
+
+    def invalidar(self, tenant_id: str, *materias) -> None:
+        """Descarta el listado completo del tenant y el de cada materia indicada"""
+        self._cargas.invalidar(tenant_id)
+        self._cache.pop((tenant_id, None))
+        for materia in materias:
+            self._cache.pop((tenant_id, _materia(materia)))
+
+    def estadisticas(self) -> dict:
+        return self._cache.estadisticas()
+
+catalogo_retos = CatalogoRetos()
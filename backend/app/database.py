@@ -1,21 +1,291 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import exc, event
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+from uuid import uuid4
+import asyncio
 import os
+import random
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Configuración del pool de conexiones
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # segundos esperando una conexión libre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # segundos antes de reemplazar una conexión
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "10"))  # segundos para abrir una conexión
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 = sin límite
+# Modo compatible con PgBouncer en transaction pooling: sin prepared statements en el servidor
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+# Cabeceras X-DB-* con el número de consultas y el tiempo en BD de cada petición
+DB_DEBUG_CONSULTAS = os.getenv("DB_DEBUG_CONSULTAS", "false").lower() == "true"
+# Veces que una misma sentencia puede repetirse en una petición antes de marcarla como posible N+1
+DB_UMBRAL_REPETIDAS = int(os.getenv("DB_UMBRAL_REPETIDAS", "3"))
+# Registro de consultas lentas: umbral (0 = desactivado), tamaño del buffer y fracción a la
+# que se le captura el plan con EXPLAIN ANALYZE
+DB_CONSULTA_LENTA_MS = float(os.getenv("DB_CONSULTA_LENTA_MS", "0"))
+DB_CONSULTAS_LENTAS_MAX = int(os.getenv("DB_CONSULTAS_LENTAS_MAX", "100"))
+DB_EXPLAIN_MUESTREO = float(os.getenv("DB_EXPLAIN_MUESTREO", "0.1"))
+DB_EXPLAIN_CONCURRENCIA = 2  # EXPLAINs simultáneos como máximo, para no cargar más una BD ya lenta
+DB_EXPLAIN_TIMEOUT_MS = 5000
+
+def _url_asincrona(url: str) -> str:
+    """Convierte una URL postgresql:// al driver asíncrono asyncpg"""
+    for prefijo in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefijo):
+            return "postgresql+asyncpg://" + url[len(prefijo):]
+    return url
+
+class PoolConMetricas(AsyncAdaptedQueuePool):
+    """Pool de conexiones que además mide cuánto esperan las peticiones por una conexión"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.esperando = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def connect(self):
+        # El tiempo incluye la espera en la cola, abrir conexiones de overflow y el pre-ping
+        self.esperando += 1
+        inicio = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            espera = time.perf_counter() - inicio
+            self.esperando -= 1
+            self.checkouts += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+
+def _connect_args() -> dict:
+    """Argumentos de conexión para asyncpg según la configuración"""
+    args = {"timeout": DB_CONNECT_TIMEOUT}
+    if DB_PGBOUNCER:
+        # PgBouncer reparte las transacciones entre conexiones de servidor distintas,
+        # así que no se pueden reutilizar prepared statements con nombre. Tampoco
+        # admite parámetros de arranque: el statement_timeout se configura en PgBouncer.
+        args["statement_cache_size"] = 0
+        args["prepared_statement_cache_size"] = 0
+        args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    elif DB_STATEMENT_TIMEOUT_MS > 0:
+        args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return args
+
+engine = create_async_engine(
+    _url_asincrona(DATABASE_URL),
+    poolclass=PoolConMetricas,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args=_connect_args(),
+)
+# expire_on_commit=False: los objetos siguen siendo legibles después del commit
+# sin disparar una recarga implícita (no permitida fuera de un await)
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-# ESTA FUNCIÓN ES NECESARIA PARA LOS DEPENDS DE FASTAPI
-def get_db():
-    db = SessionLocal()
+def estadisticas_pool() -> dict:
+    """Estado actual del pool de conexiones"""
+    pool = engine.sync_engine.pool
+    return {
+        "tamano": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "en_uso": pool.checkedout(),
+        "libres": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "esperando": pool.esperando,
+        "checkouts": pool.checkouts,
+        "timeouts": pool.timeouts,
+        "espera_media_ms": round(pool.espera_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+        "espera_max_ms": round(pool.espera_max * 1000, 3),
+    }
+
+class ConsultasPeticion:
+    """Consultas SQL ejecutadas durante una petición (o un bloque de contar_consultas)"""
+
+    def __init__(self):
+        self.total = 0
+        self.tiempo = 0.0
+        self.sentencias: Counter = Counter()
+
+    def registrar(self, sentencia: str, duracion: float) -> None:
+        self.total += 1
+        self.tiempo += duracion
+        self.sentencias[sentencia] += 1
+
+    def repetidas(self) -> dict:
+        """Sentencias idénticas ejecutadas más de DB_UMBRAL_REPETIDAS veces: candidatas a N+1"""
+        return {sentencia: veces for sentencia, veces in self.sentencias.items() if veces > DB_UMBRAL_REPETIDAS}
+
+_consultas_actuales: ContextVar[Optional[ConsultasPeticion]] = ContextVar("consultas_actuales", default=None)
+# Scope ASGI de la petición en curso, para saber desde qué ruta se lanzó una consulta lenta
+_peticion_actual: ContextVar[Optional[dict]] = ContextVar("peticion_actual", default=None)
+
+def _ruta_actual() -> Optional[str]:
+    scope = _peticion_actual.get()
+    if scope is None:
+        return None
+    ruta = scope.get("route")
+    return f"{scope['method']} {ruta.path if ruta is not None else scope['path']}"
+
+def _forma_parametros(parametros, executemany: bool) -> List[str]:
+    """Tipos de los parámetros, sin sus valores (pueden ser datos personales o contraseñas)"""
+    if executemany:
+        parametros = parametros[0] if parametros else ()
+    valores = parametros.values() if isinstance(parametros, dict) else (parametros or ())
+    return [type(valor).__name__ for valor in valores]
+
+class ConsultasLentas:
+    """Últimas consultas que superaron DB_CONSULTA_LENTA_MS, con su plan cuando se muestrea"""
+
+    def __init__(self):
+        self.registros: deque = deque(maxlen=DB_CONSULTAS_LENTAS_MAX)
+        self._explains = 0
+        self._tareas = set()
+
+    def registrar(self, sentencia: str, parametros, executemany: bool, duracion: float) -> None:
+        registro = {
+            "fecha": datetime.now(timezone.utc).isoformat(),
+            "duracion_ms": round(duracion * 1000, 1),
+            "ruta": _ruta_actual(),
+            "sql": sentencia,
+            "parametros": _forma_parametros(parametros, executemany),
+            "filas": len(parametros) if executemany else None,
+            "plan": None,
+        }
+        self.registros.append(registro)
+        print(f"[SQL lenta] {registro['duracion_ms']} ms en {registro['ruta']}: {' '.join(sentencia.split())[:200]}")
+        # ANALYZE ejecuta la sentencia: solo lecturas, y además en una transacción de solo lectura
+        if (not executemany and engine.dialect.name == "postgresql"
+                and sentencia.lstrip()[:6].upper().startswith(("SELECT", "WITH"))
+                and self._explains < DB_EXPLAIN_CONCURRENCIA and random.random() < DB_EXPLAIN_MUESTREO):
+            registro["plan"] = "pendiente"
+            self._explains += 1
+            tarea = asyncio.get_running_loop().create_task(self._explicar(registro, sentencia, tuple(parametros or ())))
+            self._tareas.add(tarea)
+            tarea.add_done_callback(self._tareas.discard)
+
+    async def _explicar(self, registro: dict, sentencia: str, parametros: tuple) -> None:
+        # Directamente con asyncpg: no pasa por los eventos del engine ni se cuenta como consulta
+        try:
+            async with engine.connect() as conn:
+                driver = (await conn.get_raw_connection()).driver_connection
+                async with driver.transaction(readonly=True):
+                    await driver.execute(f"SET LOCAL statement_timeout = {DB_EXPLAIN_TIMEOUT_MS}")
+                    filas = await driver.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {sentencia}", *parametros)
+            registro["plan"] = "\n".join(fila[0] for fila in filas)
+        except Exception as e:
+            registro["plan"] = f"No se pudo obtener el plan: {e}"
+        finally:
+            self._explains -= 1
+
+    def listar(self) -> List[dict]:
+        return list(reversed(self.registros))
+
+consultas_lentas = ConsultasLentas()
+
+# Los eventos se disparan dentro del greenlet de SQLAlchemy, que comparte el contexto de la
+# tarea asyncio de la petición, así que cada petición solo ve sus propias consultas
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    if DB_CONSULTA_LENTA_MS > 0 or _consultas_actuales.get() is not None:
+        conn.info.setdefault("inicio_consultas", []).append(time.perf_counter())
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    if not conn.info.get("inicio_consultas"):
+        return
+    duracion = time.perf_counter() - conn.info["inicio_consultas"].pop()
+    registro = _consultas_actuales.get()
+    if registro is not None:
+        registro.registrar(statement, duracion)
+    if DB_CONSULTA_LENTA_MS > 0 and duracion * 1000 >= DB_CONSULTA_LENTA_MS:
+        consultas_lentas.registrar(statement, parameters, executemany, duracion)
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _consulta_fallida(contexto):
+    # Sin after_cursor_execute: se descarta el inicio apilado para no desalinear las siguientes
+    if contexto.connection is not None and contexto.connection.info.get("inicio_consultas"):
+        contexto.connection.info["inicio_consultas"].pop()
+
+@contextmanager
+def contar_consultas() -> Iterator[ConsultasPeticion]:
+    """
+    Cuenta las consultas que se ejecutan dentro del bloque, por ejemplo para fijar en un test
+    el presupuesto de consultas de un endpoint:
+
+        with contar_consultas() as consultas:
+            client.post("/retos/completar", ...)
+        assert consultas.total <= 2
+    """
+    registro = ConsultasPeticion()
+    token = _consultas_actuales.set(registro)
     try:
-        yield db
+        yield registro
     finally:
-        db.close()
+        _consultas_actuales.reset(token)
+
+class MiddlewareConsultas:
+    """
+    Middleware ASGI que deja la petición en curso a la vista de los eventos del engine (ruta de
+    las consultas lentas). Con DB_DEBUG_CONSULTAS además cuenta las consultas, añade
+    X-DB-Queries, X-DB-Time-Ms y X-DB-Repeated a la respuesta y avisa en el log de las
+    sentencias repetidas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (DB_DEBUG_CONSULTAS or DB_CONSULTA_LENTA_MS > 0):
+            return await self.app(scope, receive, send)
+
+        token_peticion = _peticion_actual.set(scope)
+        if not DB_DEBUG_CONSULTAS:
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                _peticion_actual.reset(token_peticion)
+
+        registro = ConsultasPeticion()
+        token = _consultas_actuales.set(registro)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                mensaje["headers"] = [*mensaje.get("headers", ()),
+                    (b"x-db-queries", str(registro.total).encode()),
+                    (b"x-db-time-ms", f"{registro.tiempo * 1000:.1f}".encode()),
+                    (b"x-db-repeated", str(len(registro.repetidas())).encode())]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _consultas_actuales.reset(token)
+            _peticion_actual.reset(token_peticion)
+            for sentencia, veces in registro.repetidas().items():
+                print(f"[N+1?] {scope['method']} {scope['path']}: {veces} veces: {' '.join(sentencia.split())[:200]}")
+
+# ESTA FUNCIÓN ES NECESARIA PARA LOS DEPENDS DE FASTAPI
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+import asyncio
+import os
+import tempfile
+from sqlalchemy import update
+from app.database import SessionLocal
+from app.models.usuario import Usuario
+from app.ranking import motor_ranking
+from app.versiones import versiones
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Sin Pillow no se generan variantes y se sirve siempre el original
+    Image = None
+
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', 'static', 'profile_images')
+URL_IMAGENES = "/static/profile_images"
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# Lado máximo en píxeles de cada variante (avatar: 48 px a densidad 2x en la app)
+VARIANTES = {"medium": 512, "avatar": 96}
+# Columna de usuarios donde se guarda la URL de cada variante
+COLUMNA_POR_VARIANTE = {
+    "avatar": "profile_image_avatar_url",
+    "medium": "profile_image_medium_url",
+}
+IMAGENES_CONCURRENCIA = int(os.getenv("IMAGENES_CONCURRENCIA", "2"))
+IMAGENES_CALIDAD = int(os.getenv("IMAGENES_CALIDAD", "80"))
+# Límite de píxeles del original: un PNG de pocos MB puede descomprimirse en gigas de memoria
+IMAGENES_MAX_PIXELES = int(os.getenv("IMAGENES_MAX_PIXELES", str(40_000_000)))
+
+_executor = ThreadPoolExecutor(max_workers=IMAGENES_CONCURRENCIA, thread_name_prefix="imagenes")
+_stats = {"en_curso": 0, "completados": 0, "errores": 0}
+
+def _extension_variantes() -> str:
+    return ".webp" if features.check("webp") else ".jpg"
+
+def _guardar(imagen, ruta: str) -> None:
+    """Escribe la variante en un temporal y la mueve a su sitio, para no exponer archivos a medias"""
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix=".variante-", delete=False) as temporal:
+        try:
+            if ruta.endswith(".webp"):
+                imagen.save(temporal, "WEBP", quality=IMAGENES_CALIDAD, method=4)
+            else:
+                imagen.convert("RGB").save(temporal, "JPEG", quality=IMAGENES_CALIDAD, optimize=True, progressive=True)
+        except BaseException:
+            os.unlink(temporal.name)
+            raise
+    os.chmod(temporal.name, 0o644)
+    os.replace(temporal.name, ruta)
+
+def generar_variantes(filename: str) -> Dict[str, str]:
+    """
+    Genera las variantes reducidas de una imagen de perfil ya guardada y devuelve su nombre
+    de archivo por variante. Los nombres derivan del hash del original, así que si ya
+    existen (la misma imagen subida antes) no se vuelven a generar.
+    """
+    base = os.path.splitext(filename)[0]
+    ext = _extension_variantes()
+    nombres = {variante: f"{base}_{variante}{ext}" for variante in VARIANTES}
+    if all(os.path.exists(os.path.join(UPLOAD_DIR, nombre)) for nombre in nombres.values()):
+        return nombres
+
+    with Image.open(os.path.join(UPLOAD_DIR, filename)) as original:
+        if original.width * original.height > IMAGENES_MAX_PIXELES:
+            raise ValueError(f"imagen de {original.width}x{original.height} píxeles")
+        # En JPEG decodifica directamente a una escala reducida (1/2, 1/4, 1/8)
+        lado_max = max(VARIANTES.values())
+        original.draft("RGB", (lado_max, lado_max))
+        imagen = ImageOps.exif_transpose(original)
+        imagen = imagen.convert("RGBA" if "A" in imagen.getbands() or "transparency" in imagen.info else "RGB")
+
+    # De mayor a menor: cada variante se reduce a partir de la anterior, que ya es pequeña
+    for variante, lado in sorted(VARIANTES.items(), key=lambda par: -par[1]):
+        imagen.thumbnail((lado, lado), Image.LANCZOS)
+        _guardar(imagen, os.path.join(UPLOAD_DIR, nombres[variante]))
+    return nombres
+
+async def procesar_imagen_perfil(user_id: int, filename: str) -> None:
+    """
+    Tarea en segundo plano tras subir una foto: genera las variantes en el pool de imágenes y
+    guarda sus URLs, solo si el usuario sigue teniendo esa foto (pudo subir otra mientras tanto).
+    """
+    if Image is None:
+        return
+    _stats["en_curso"] += 1
+    try:
+        nombres = await asyncio.get_running_loop().run_in_executor(_executor, generar_variantes, filename)
+    except Exception as e:
+        _stats["errores"] += 1
+        print(f"[imagenes] No se pudieron generar las variantes de {filename}: {e}")
+        return
+    finally:
+        _stats["en_curso"] -= 1
+
+    usuarios = Usuario.__table__
+    async with SessionLocal() as db:
+        result = await db.execute(
+            update(usuarios)
+            .where(usuarios.c.id == user_id, usuarios.c.profile_image_url == f"{URL_IMAGENES}/{filename}")
+            .values({COLUMNA_POR_VARIANTE[variante]: f"{URL_IMAGENES}/{nombre}" for variante, nombre in nombres.items()})
+            .returning(usuarios.c.tenant_id, usuarios.c.grado)
+        )
+        fila = result.first()
+        await db.commit()
+    _stats["completados"] += 1
+    if fila is not None:
+        motor_ranking.actualizar_avatar(fila.tenant_id, fila.grado, user_id, f"{URL_IMAGENES}/{nombres['avatar']}")
+        versiones.incrementar("ranking", fila.tenant_id)
+
+def url_variante(usuario: Usuario, variante: Optional[str]) -> Optional[str]:
+    """URL de la variante pedida, o del original si no existe o aún no está generada"""
+    columna = COLUMNA_POR_VARIANTE.get(variante)
+    return (columna and getattr(usuario, columna)) or usuario.profile_image_url
+
+def estadisticas_imagenes() -> dict:
+    """Estado del pool que genera las variantes de las fotos de perfil"""
+    return {
+        "disponible": Image is not None,
+        "concurrencia": IMAGENES_CONCURRENCIA,
+        "variantes": VARIANTES,
+        **_stats,
+    }
+
+def cerrar_imagenes() -> None:
+    _executor.shutdown(wait=True, cancel_futures=True)
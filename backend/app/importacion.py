@@ -0,0 +1,169 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import os
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.auth import hash_password, Principal, BCRYPT_ROUNDS
+from app.models.usuario import Usuario, RolEnum
+from app.schemas.usuario import EstudianteCreateByProfesor
+from app.utils.edad_utils import validar_fecha_nacimiento
+from app.utils.unicidad import emails_generados
+
+IMPORTACION_MAX_FILAS = int(os.getenv("IMPORTACION_MAX_FILAS", "2000"))
+# Coste bcrypt de las contraseñas importadas. Bajarlo acelera mucho las importaciones
+# grandes; cada hash se rehace con BCRYPT_ROUNDS en el primer login del estudiante.
+IMPORTACION_BCRYPT_ROUNDS = int(os.getenv("IMPORTACION_BCRYPT_ROUNDS", str(BCRYPT_ROUNDS)))
+
+def _describir_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(parte) for parte in e['loc'])}: {e['msg']}" for e in error.errors())
+
+class _Fila:
+    def __init__(self, numero: int, datos: Dict[str, Any]):
+        self.numero = numero
+        # Hasta validar la fila el DNI puede llegar con otro tipo (p. ej. un número en el JSON)
+        dni = datos.get("dni")
+        self.dni: Optional[str] = str(dni) if dni not in (None, "") else None
+        self.estudiante: Optional[EstudianteCreateByProfesor] = None
+        self.email: Optional[str] = None
+        self.error: Optional[str] = None
+        self.id: Optional[int] = None
+
+    def resultado(self) -> dict:
+        return {
+            "fila": self.numero,
+            "dni": self.dni,
+            "estado": "error" if self.error else "creado",
+            "id": self.id,
+            "email": self.email,
+            "error": self.error,
+        }
+
+async def _emails_ocupados(db: AsyncSession, emails: List[str]) -> set:
+    if not emails:
+        return set()
+    result = await db.execute(select(Usuario.email).where(Usuario.email.in_(emails)))
+    return set(result.scalars().all())
+
+async def importar_estudiantes(db: AsyncSession, datos: List[Dict[str, Any]], profesor: Principal) -> dict:
+    """
+    Crea en bloque los estudiantes válidos de un listado y devuelve el resultado de cada fila.
+    Las comprobaciones de duplicados se hacen con una consulta por clave para todo el lote y
+    la inserción con una única sentencia de varias filas.
+    """
+    filas = [_Fila(numero, fila) for numero, fila in enumerate(datos, start=1)]
+
+    # 1. Validación de cada fila por separado, para poder informar de todos los errores
+    for fila, crudo in zip(filas, datos):
+        try:
+            fila.estudiante = EstudianteCreateByProfesor(**crudo)
+        except ValidationError as e:
+            fila.error = _describir_error(e)
+            continue
+        fila.dni = fila.estudiante.dni
+        if not validar_fecha_nacimiento(fila.estudiante.fecha_nacimiento):
+            fila.error = "La fecha de nacimiento no es válida. El estudiante debe tener entre 5 y 25 años."
+
+    # 2. Duplicados dentro del propio lote
+    vistos_dni, vistos_email = set(), set()
+    for fila in filas:
+        if fila.error:
+            continue
+        if fila.dni in vistos_dni:
+            fila.error = "El DNI está repetido en el listado"
+        elif fila.estudiante.email and fila.estudiante.email in vistos_email:
+            fila.error = "El email está repetido en el listado"
+        vistos_dni.add(fila.dni)
+        if fila.estudiante.email:
+            vistos_email.add(fila.estudiante.email)
+    validas = [fila for fila in filas if not fila.error]
+
+    # 3. Duplicados contra la base de datos: una consulta por clave
+    dnis = [fila.dni for fila in validas]
+    if dnis:
+        # El DNI también es el username del estudiante
+        result = await db.execute(select(Usuario.dni, Usuario.username).where(
+            or_(Usuario.dni.in_(dnis), Usuario.username.in_(dnis))
+        ))
+        dnis_usuarios = {valor for par in result.all() for valor in par}
+        for fila in validas:
+            if fila.dni in dnis_usuarios:
+                fila.error = "El DNI ya está registrado en usuarios"
+        validas = [fila for fila in validas if not fila.error]
+
+    for fila in validas:
+        fila.email = fila.estudiante.email or emails_generados(fila.dni)[0]
+    ocupados = await _emails_ocupados(db, [fila.email for fila in validas])
+    for fila in validas:
+        if fila.email in ocupados and fila.estudiante.email:
+            fila.error = "El email ya está registrado"
+    validas = [fila for fila in validas if not fila.error]
+
+    # Emails generados que ya existen (o que otra fila del lote usa explícitamente):
+    # alternativas deterministas, comprobadas en una sola consulta
+    en_conflicto = [
+        fila for fila in validas
+        if not fila.estudiante.email and (fila.email in ocupados or fila.email in vistos_email)
+    ]
+    if en_conflicto:
+        alternativas = {
+            fila.numero: emails_generados(fila.dni)[1:]
+            for fila in en_conflicto
+        }
+        ocupados |= vistos_email | await _emails_ocupados(db, [email for lista in alternativas.values() for email in lista])
+        asignados = {fila.email for fila in validas if fila not in en_conflicto}
+        for fila in en_conflicto:
+            libre = next((email for email in alternativas[fila.numero] if email not in ocupados | asignados), None)
+            if libre is None:
+                fila.error = "No se pudo generar un email libre para el estudiante"
+            else:
+                fila.email = libre
+                asignados.add(libre)
+        validas = [fila for fila in validas if not fila.error]
+
+    if not validas:
+        return _resumen(filas)
+
+    # Devuelve la conexión al pool antes de hashear: con miles de filas el hashing dura minutos
+    # y la transacción de las comprobaciones quedaría "idle in transaction" todo ese tiempo.
+    # Si otro proceso registra un DNI o email mientras tanto, la inserción da IntegrityError (409).
+    await db.rollback()
+
+    # 4. Hash de contraseñas en paralelo (acotado por el pool de hashing)
+    hashes = await asyncio.gather(*[
+        hash_password(fila.estudiante.password, IMPORTACION_BCRYPT_ROUNDS) for fila in validas
+    ])
+
+    # 5. Una inserción de varias filas
+    result = await db.execute(
+        insert(Usuario.__table__).returning(Usuario.__table__.c.id, Usuario.__table__.c.dni),
+        [
+            {
+                "username": fila.dni,
+                "email": fila.email,
+                "password_hash": password_hash,
+                "rol": RolEnum.ESTUDIANTE,
+                "nombre": fila.estudiante.nombre,
+                "apellido": fila.estudiante.apellido,
+                "dni": fila.dni,
+                "fecha_nacimiento": fila.estudiante.fecha_nacimiento,
+                "edad": fila.estudiante.edad,
+                "grado": fila.estudiante.grado,
+                "seccion": fila.estudiante.seccion,
+                "sexo": fila.estudiante.sexo,
+                "tenant_id": profesor.tenant_id,
+            }
+            for fila, password_hash in zip(validas, hashes)
+        ],
+    )
+    ids = {dni: id_ for id_, dni in result.all()}
+    await db.commit()
+
+    for fila in validas:
+        fila.id = ids[fila.dni]
+    return _resumen(filas)
+
+def _resumen(filas: List[_Fila]) -> dict:
+    resultados = [fila.resultado() for fila in filas]
+    errores = sum(1 for r in resultados if r["estado"] == "error")
+    return {"creados": len(resultados) - errores, "errores": errores, "resultados": resultados}
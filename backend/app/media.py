@@ -0,0 +1,38 @@
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+import os
+import re
+
+# Las fotos y sus variantes se nombran por el sha256 del contenido: una URL nunca cambia de contenido
+NOMBRE_CON_HASH = re.compile(r"^[0-9a-f]{64}(_[a-z]+)?\.(jpg|png|gif|webp)$")
+MEDIA_CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+# Para archivos sin hash en el nombre: el cliente debe revalidar (ETag / Last-Modified)
+MEDIA_CACHE_REVALIDAR = os.getenv("MEDIA_CACHE_REVALIDAR", "public, no-cache")
+
+class MediaEstatica(StaticFiles):
+    """
+    Archivos subidos por los usuarios. Starlette ya resuelve ETag, Last-Modified, 304 y
+    peticiones Range, y envía el archivo con http.response.pathsend (sin copiarlo por
+    Python) cuando el servidor ASGI lo soporta; aquí se añade la política de cache.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        # Los temporales de subida (.subida-*, .variante-*) no se publican
+        if os.path.basename(path).startswith("."):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        inmutable = NOMBRE_CON_HASH.match(os.path.basename(full_path))
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            headers={"Cache-Control": MEDIA_CACHE_INMUTABLE if inmutable else MEDIA_CACHE_REVALIDAR},
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
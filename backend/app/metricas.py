@@ -0,0 +1,126 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Tuple
+import os
+import time
+
+# Límites de los histogramas (segundos y bytes), al estilo de los de Prometheus
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_TAMANO = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+# Si se define, /metrics exige "Authorization: Bearer <token>"
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+# Etiqueta para peticiones que no casan con ninguna ruta (evita una serie por cada URL inventada)
+RUTA_DESCONOCIDA = "desconocida"
+
+class _Histograma:
+    __slots__ = ("limites", "cubetas", "suma", "cuenta")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cubetas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, valor: float) -> None:
+        self.cubetas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.cuenta += 1
+
+class Metricas:
+    """Contadores por (método, ruta) en memoria del worker; cada worker expone los suyos"""
+
+    def __init__(self):
+        self.peticiones: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.latencia: Dict[Tuple[str, str], _Histograma] = {}
+        self.tamano: Dict[Tuple[str, str], _Histograma] = {}
+        self.en_curso: Dict[str, int] = defaultdict(int)
+
+    def registrar(self, metodo: str, ruta: str, estado: int, duracion: float, bytes_enviados: int) -> None:
+        clave = (metodo, ruta)
+        self.peticiones[(metodo, ruta, estado)] += 1
+        if clave not in self.latencia:
+            self.latencia[clave] = _Histograma(BUCKETS_LATENCIA)
+            self.tamano[clave] = _Histograma(BUCKETS_TAMANO)
+        self.latencia[clave].observar(duracion)
+        self.tamano[clave].observar(bytes_enviados)
+
+    def exportar(self) -> str:
+        """Formato de texto de Prometheus (version 0.0.4)"""
+        lineas: List[str] = []
+        lineas += ["# HELP http_requests_total Peticiones HTTP atendidas.",
+                   "# TYPE http_requests_total counter"]
+        for (metodo, ruta, estado), total in sorted(self.peticiones.items()):
+            lineas.append(f'http_requests_total{{method="{metodo}",route="{_escapar(ruta)}",status="{estado}"}} {total}')
+        lineas += ["# HELP http_requests_in_progress Peticiones HTTP en curso.",
+                   "# TYPE http_requests_in_progress gauge"]
+        for metodo, total in sorted(self.en_curso.items()):
+            lineas.append(f'http_requests_in_progress{{method="{metodo}"}} {total}')
+        lineas += _exportar_histogramas("http_request_duration_seconds", "Duración de las peticiones HTTP.", self.latencia)
+        lineas += _exportar_histogramas("http_response_size_bytes", "Tamaño del cuerpo de las respuestas HTTP.", self.tamano)
+        return "\n".join(lineas) + "\n"
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _exportar_histogramas(nombre: str, ayuda: str, histogramas: Dict[Tuple[str, str], _Histograma]) -> List[str]:
+    lineas = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+    for (metodo, ruta), histograma in sorted(histogramas.items()):
+        etiquetas = f'method="{metodo}",route="{_escapar(ruta)}"'
+        acumulado = 0
+        for limite, cuenta in zip((*histograma.limites, "+Inf"), histograma.cubetas):
+            acumulado += cuenta
+            lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}')
+        lineas.append(f"{nombre}_sum{{{etiquetas}}} {histograma.suma}")
+        lineas.append(f"{nombre}_count{{{etiquetas}}} {histograma.cuenta}")
+    return lineas
+
+metricas = Metricas()
+
+def _ruta(scope, root_path_inicial: str) -> str:
+    """Plantilla de la ruta que atendió la petición (/retos/{reto_id}), no la URL concreta"""
+    ruta = scope.get("route")
+    if ruta is not None:
+        return scope.get("root_path", "")[len(root_path_inicial):] + ruta.path
+    # Apps montadas (archivos estáticos): el router deja el prefijo del montaje en root_path
+    montaje = scope.get("root_path", "")[len(root_path_inicial):]
+    return montaje or RUTA_DESCONOCIDA
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI puro (sin BaseHTTPMiddleware, que añade una tarea y colas por petición):
+    mide duración, estado y bytes del cuerpo de cada petición HTTP.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        metodo = scope["method"]
+        root_path = scope.get("root_path", "")
+        estado = 500  # si la app falla sin responder
+        declarados = None  # content-length, si la respuesta lo trae
+        enviados = 0
+
+        async def enviar(mensaje):
+            nonlocal estado, declarados, enviados
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                for nombre, valor in mensaje.get("headers", ()):
+                    if nombre == b"content-length" and valor.isdigit():
+                        declarados = int(valor)
+            elif mensaje["type"] == "http.response.body":
+                enviados += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        metricas.en_curso[metodo] += 1
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            metricas.en_curso[metodo] -= 1
+            # Los archivos enviados con pathsend no pasan por http.response.body: cuenta el content-length
+            metricas.registrar(metodo, _ruta(scope, root_path), estado, time.perf_counter() - inicio,
+                               declarados if declarados is not None else enviados)
@@ -1,4 +1,3 @@
-from .estudiante import Estudiante
 from .usuario import Usuario, RolEnum
 from .reto import Reto, MateriaEnum, NivelEnum
 from .progreso_reto import ProgresoReto
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Boolean, UniqueConstraint, Index, false
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -8,8 +8,15 @@ class ProgresoReto(Base):
     id = Column(Integer, primary_key=True, index=True)
     estudiante_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
     reto_id = Column(Integer, ForeignKey("retos.id"), nullable=False)
-    completado = Column(String, nullable=False, default="false")  # "true" o "false"
+    completado = Column(Boolean, nullable=False, default=False, server_default=false())
     puntos_obtenidos = Column(Integer, nullable=False, default=0)
     fecha_completado = Column(DateTime(timezone=True), nullable=True)
-    # Removido temporalmente: created_at = Column(DateTime(timezone=True), server_default=func.now())
-    # Removido temporalmente: updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Lo usa /sync para enviar solo lo modificado; las sentencias Core deben fijarlo a mano
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # Un único progreso por estudiante y reto; también sirve de índice para mi-progreso
+        UniqueConstraint("estudiante_id", "reto_id", name="uq_progreso_retos_estudiante_reto"),
+        Index("ix_progreso_retos_estudiante_updated_at", "estudiante_id", "updated_at"),
+    )
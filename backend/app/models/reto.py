@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, DateTime
+from sqlalchemy import Column, Integer, String, Enum, DateTime, Boolean, Index, text, true
 from sqlalchemy.sql import func
 from app.database import Base
 import enum
@@ -25,7 +25,14 @@ class Reto(Base):
     nivel = Column(Enum(NivelEnum), nullable=False)
     materia = Column(Enum(MateriaEnum), nullable=False)
     profesor_id = Column(Integer, nullable=False)  # ID del profesor que lo creó
-    activo = Column(String, nullable=False, default="true")
+    activo = Column(Boolean, nullable=False, default=True, server_default=true())
     tenant_id = Column(String, nullable=False, default="default")
-    # Removido temporalmente: created_at = Column(DateTime(timezone=True), server_default=func.now())
-    # Removido temporalmente: updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Lo usa /sync para enviar solo lo modificado; las sentencias Core deben fijarlo a mano
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_retos_tenant_materia_activos", "tenant_id", "materia", postgresql_where=text("activo")),
+        Index("ix_retos_profesor_activos", "profesor_id", postgresql_where=text("activo")),
+        Index("ix_retos_tenant_updated_at", "tenant_id", "updated_at"),
+    )
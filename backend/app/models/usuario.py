@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Enum, DateTime, Date
+from sqlalchemy import Column, Integer, String, Enum, DateTime, Date, Boolean, Index, text, true
+from sqlalchemy.orm import synonym
 from sqlalchemy.sql import func
 from app.database import Base
 import enum
@@ -31,8 +32,29 @@ class Usuario(Base):
     puntos_ciencia_tecnologia = Column(Integer, nullable=False, default=0)
     puntos_ingles = Column(Integer, nullable=False, default=0)
     puntos_totales = Column(Integer, nullable=False, default=0)
-    activo = Column(String, nullable=False, default="true")
+    activo = Column(Boolean, nullable=False, default=True, server_default=true())
     tenant_id = Column(String, nullable=False, default="default")
     profile_image_url = Column(String, nullable=True)
+    # Variantes reducidas de la foto, generadas en segundo plano tras la subida
+    profile_image_avatar_url = Column(String, nullable=True)
+    profile_image_medium_url = Column(String, nullable=True)
+    # Nombre que usa /estudiantes (antes tabla estudiantes) para el email
+    correo = synonym("email")
     # Removido temporalmente: created_at = Column(DateTime(timezone=True), server_default=func.now())
     # Removido temporalmente: updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        # Carga del ranking: usuarios activos de un tenant/grado ordenados por puntos.
+        # El rol queda fuera del predicado porque las etiquetas de rolenum difieren según
+        # si la tabla la creó create_all (nombres) o la migración inicial (valores).
+        Index("ix_usuarios_ranking", "tenant_id", "grado", "puntos_totales", postgresql_where=text("activo")),
+    )
+
+# Columna de puntos asociada a cada materia (las claves son los valores de MateriaEnum)
+PUNTOS_POR_MATERIA = {
+    "matematicas": "puntos_matematicas",
+    "comunicacion": "puntos_comunicacion",
+    "personal_social": "puntos_personal_social",
+    "ciencia_tecnologia": "puntos_ciencia_tecnologia",
+    "ingles": "puntos_ingles",
+}
@@ -0,0 +1,117 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+from uuid import uuid4
+import asyncio
+import json
+import os
+import tempfile
+import time
+from app.auth import admin_desde_token
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # Sin pyinstrument el indicador de perfilado se ignora
+    Profiler = None
+
+PERFILES_DIR = os.getenv("PERFILES_DIR", os.path.join(tempfile.gettempdir(), "perfiles-api"))
+# Perfiles que se conservan; al guardar uno nuevo se borran los más antiguos
+PERFILES_MAX = int(os.getenv("PERFILES_MAX", "20"))
+PERFILADO_INTERVALO = float(os.getenv("PERFILADO_INTERVALO", "0.001"))  # segundos entre muestras
+# Se pide con ?perfilar=1 o con la cabecera X-Perfilar: 1, y solo vale con un token de administrador
+PARAMETRO_PERFILAR = b"perfilar=1"
+CABECERA_PERFILAR = b"x-perfilar"
+
+def _pide_perfil(scope) -> bool:
+    if PARAMETRO_PERFILAR in scope.get("query_string", b""):
+        return True
+    return any(nombre == CABECERA_PERFILAR and valor == b"1" for nombre, valor in scope["headers"])
+
+def _token(scope) -> Optional[str]:
+    for nombre, valor in scope["headers"]:
+        if nombre == b"authorization" and valor[:7].lower() == b"bearer ":
+            return valor[7:].decode("latin-1")
+    return None
+
+def _guardar(profiler, metadatos: dict) -> None:
+    """Escribe el perfil (formato speedscope) y sus metadatos, y aplica la retención"""
+    os.makedirs(PERFILES_DIR, exist_ok=True)
+    with open(os.path.join(PERFILES_DIR, f"{metadatos['id']}.speedscope.json"), "w") as archivo:
+        archivo.write(profiler.output(renderer=SpeedscopeRenderer()))
+    with open(os.path.join(PERFILES_DIR, f"{metadatos['id']}.json"), "w") as archivo:
+        json.dump(metadatos, archivo)
+    for antiguo in listar_perfiles()[PERFILES_MAX:]:
+        for sufijo in (".json", ".speedscope.json"):
+            try:
+                os.remove(os.path.join(PERFILES_DIR, antiguo["id"] + sufijo))
+            except FileNotFoundError:
+                pass  # otro worker lo borró antes
+
+def listar_perfiles() -> List[dict]:
+    """Metadatos de los perfiles guardados (de todos los workers), del más reciente al más antiguo"""
+    perfiles = []
+    if not os.path.isdir(PERFILES_DIR):
+        return perfiles
+    for nombre in os.listdir(PERFILES_DIR):
+        if nombre.endswith(".json") and not nombre.endswith(".speedscope.json"):
+            try:
+                with open(os.path.join(PERFILES_DIR, nombre)) as archivo:
+                    perfiles.append(json.load(archivo))
+            except (OSError, ValueError):
+                continue
+    return sorted(perfiles, key=lambda perfil: perfil["fecha"], reverse=True)
+
+def ruta_perfil(perfil_id: str) -> Optional[str]:
+    """Archivo speedscope de un perfil, o None si no existe (el id solo puede ser un uuid)"""
+    ruta = os.path.join(PERFILES_DIR, f"{perfil_id}.speedscope.json")
+    return ruta if len(perfil_id) == 32 and perfil_id.isalnum() and os.path.exists(ruta) else None
+
+class MiddlewarePerfilado:
+    """
+    Middleware ASGI que ejecuta bajo pyinstrument las peticiones que lo piden con un token de
+    administrador. El resto solo paga la comprobación del indicador en la query y las cabeceras.
+    La respuesta lleva X-Perfil con el id del perfil guardado.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or Profiler is None or not _pide_perfil(scope):
+            return await self.app(scope, receive, send)
+        token = _token(scope)
+        admin = await admin_desde_token(token) if token else None
+        if admin is None:
+            return await self.app(scope, receive, send)
+
+        perfil_id = uuid4().hex
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                mensaje["headers"] = [*mensaje.get("headers", ()), (b"x-perfil", perfil_id.encode())]
+            await send(mensaje)
+
+        # async_mode="enabled": solo se muestrea esta tarea, no las demás peticiones del worker.
+        # Lo que corre en otros hilos (bcrypt, variantes de imágenes) aparece como espera del await.
+        profiler = Profiler(interval=PERFILADO_INTERVALO, async_mode="enabled")
+        inicio = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            profiler.stop()
+            ruta = scope.get("route")
+            metadatos = {
+                "id": perfil_id,
+                "fecha": datetime.now(timezone.utc).isoformat(),
+                "metodo": scope["method"],
+                "ruta": ruta.path if ruta is not None else scope["path"],
+                "estado": estado,
+                "duracion_ms": round((time.perf_counter() - inicio) * 1000, 1),
+                "usuario": admin.username,
+            }
+            # Renderizar y escribir el perfil no bloquea el bucle de eventos
+            await asyncio.to_thread(_guardar, profiler, metadatos)
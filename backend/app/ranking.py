@@ -0,0 +1,179 @@
+from itertools import islice
+from typing import Dict, List, Optional
+import math
+import os
+from sortedcontainers import SortedList
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.usuario import Usuario, RolEnum, PUNTOS_POR_MATERIA
+from app.utils.cache import CacheLRU, CargaUnica
+
+# Segundos tras los que un grupo se vuelve a cargar desde la BD. Cada worker mantiene
+# su propia copia, así que esto acota el desfase con los puntos otorgados en otro worker.
+RANKING_TTL = float(os.getenv("RANKING_TTL", "60"))
+# Grupos (tenant, grado) en memoria como máximo; el grado llega en la query string
+RANKING_GRUPOS_MAX = int(os.getenv("RANKING_GRUPOS_MAX", "500"))
+
+COLUMNAS_PUNTOS = (*PUNTOS_POR_MATERIA.values(), "puntos_totales")
+CAMPOS_RANKING = ("id", "nombre", "apellido", "grado", "seccion", "profile_image_avatar_url", *COLUMNAS_PUNTOS)
+
+def columna_de_materia(materia: Optional[str]) -> str:
+    """Columna de puntos por la que se ordena; sin materia (o desconocida) se usan los totales"""
+    return PUNTOS_POR_MATERIA.get(getattr(materia, "value", materia), "puntos_totales")
+
+class SinGrado(Exception):
+    """El estudiante no tiene grado asignado: no hay grupo con el que compararlo"""
+
+class _Grupo:
+    """Estudiantes activos de un (tenant, grado) con una clasificación ordenada por cada columna de puntos"""
+
+    def __init__(self, filas):
+        self.alumnos: Dict[int, dict] = {fila["id"]: dict(fila) for fila in filas}
+        self.tablas: Dict[str, SortedList] = {
+            columna: SortedList((-alumno[columna], alumno["id"]) for alumno in self.alumnos.values())
+            for columna in COLUMNAS_PUNTOS
+        }
+
+    def agregar(self, alumno: dict) -> None:
+        self.quitar(alumno["id"])
+        self.alumnos[alumno["id"]] = alumno
+        for columna, tabla in self.tablas.items():
+            tabla.add((-alumno[columna], alumno["id"]))
+
+    def quitar(self, alumno_id: int) -> None:
+        alumno = self.alumnos.pop(alumno_id, None)
+        if alumno is None:
+            return
+        for columna, tabla in self.tablas.items():
+            tabla.remove((-alumno[columna], alumno_id))
+
+    def sumar(self, alumno_id: int, columna: str, delta: int) -> None:
+        """Suma puntos a una materia y a los totales en O(log n)"""
+        alumno = self.alumnos.get(alumno_id)
+        if alumno is None:
+            return
+        for col in (columna, "puntos_totales"):
+            tabla = self.tablas[col]
+            tabla.remove((-alumno[col], alumno_id))
+            alumno[col] += delta
+            tabla.add((-alumno[col], alumno_id))
+
+    def top(self, columna: str, n: int) -> List[dict]:
+        return [self.alumnos[alumno_id] for _, alumno_id in islice(self.tablas[columna], n)]
+
+    def posicion(self, alumno_id: int, columna: str) -> dict:
+        """Posición de un alumno en una columna, con sus vecinos inmediatos, en O(log n)"""
+        tabla = self.tablas[columna]
+        puntos = self.alumnos[alumno_id][columna]
+        total = len(tabla)
+        mejores = tabla.bisect_left((-puntos,))  # alumnos con más puntos
+        menos = total - tabla.bisect_right((-puntos, math.inf))  # alumnos con menos puntos
+        indice = tabla.index((-puntos, alumno_id))
+        return {
+            "puntos": puntos,
+            "posicion": mejores + 1,
+            "total": total,
+            "percentil": round((menos + (total - mejores - menos) / 2) / total * 100, 1),
+            "anterior": self.alumnos[tabla[indice - 1][1]] if indice > 0 else None,
+            "siguiente": self.alumnos[tabla[indice + 1][1]] if indice + 1 < total else None,
+        }
+
+class MotorRanking:
+    """
+    Clasificaciones en memoria por (tenant_id, grado, materia). Cada grupo se carga desde la
+    BD la primera vez que se consulta y después se mantiene con las sumas de puntos.
+    grado=None representa a todos los grados del tenant.
+    """
+
+    def __init__(self):
+        self._grupos = CacheLRU(maxsize=RANKING_GRUPOS_MAX, ttl=RANKING_TTL)
+        # Un solo lector carga cada grupo aunque lleguen muchas peticiones a la vez
+        self._cargas = CargaUnica(self._grupos)
+
+    async def _grupo(self, db: AsyncSession, tenant_id: str, grado: Optional[str]) -> _Grupo:
+        async def cargar() -> _Grupo:
+            consulta = select(*[getattr(Usuario, campo) for campo in CAMPOS_RANKING]).where(
+                Usuario.rol == RolEnum.ESTUDIANTE,
+                Usuario.tenant_id == tenant_id,
+                Usuario.activo
+            )
+            if grado is not None:
+                consulta = consulta.where(Usuario.grado == grado)
+            result = await db.execute(consulta)
+            return _Grupo(result.mappings().all())
+
+        # Un grado sin estudiantes (o inventado en la query string) no ocupa sitio en la cache;
+        # además agregar_alumno no tendría dónde poner al primer alumno que se registre en él
+        return await self._cargas.obtener(
+            (tenant_id, grado), tenant_id, cargar,
+            guardar_si=lambda grupo: bool(grupo.alumnos) or grado is None
+        )
+
+    async def top(self, db: AsyncSession, tenant_id: str, grado: Optional[str], materia: Optional[str], n: int = 20) -> List[dict]:
+        grupo = await self._grupo(db, tenant_id, grado)
+        return grupo.top(columna_de_materia(materia), n)
+
+    async def posicion(self, db: AsyncSession, tenant_id: str, alumno_id: int) -> Optional[dict]:
+        """Posición del alumno dentro de su grado, por materia y en general; SinGrado si no tiene grado"""
+        alumno = (await self._grupo(db, tenant_id, None)).alumnos.get(alumno_id)
+        if alumno is None:
+            return None
+        # grado=None es todo el tenant, no un grupo del alumno
+        if alumno["grado"] is None:
+            raise SinGrado()
+        grupo = await self._grupo(db, tenant_id, alumno["grado"])
+        if alumno_id not in grupo.alumnos:
+            return None
+        return {
+            "grado": alumno["grado"],
+            "general": {"materia": "general", **grupo.posicion(alumno_id, "puntos_totales")},
+            "materias": [
+                {"materia": materia, **grupo.posicion(alumno_id, columna)}
+                for materia, columna in PUNTOS_POR_MATERIA.items()
+            ],
+        }
+
+    def escritura(self, tenant_id: str):
+        """
+        Envuelve la actualización de puntos en la BD, su commit y la llamada a sumar_puntos.
+        Una carga en frío que se solape con ella no se guarda: su SELECT podría ver ya los
+        puntos confirmados y sumar_puntos los añadiría otra vez.
+        """
+        return self._cargas.escritura(tenant_id)
+
+    def sumar_puntos(self, tenant_id: str, grado: Optional[str], alumno_id: int, materia: str, delta: int) -> None:
+        """Aplica a los grupos cargados los puntos ya confirmados en la BD (dentro de escritura())"""
+        columna = columna_de_materia(materia)
+        for clave in {(tenant_id, grado), (tenant_id, None)}:
+            grupo = self._grupos.get(clave)
+            if grupo is not None:
+                grupo.sumar(alumno_id, columna, delta)
+
+    def actualizar_avatar(self, tenant_id: str, grado: Optional[str], alumno_id: int, url: Optional[str]) -> None:
+        """Refleja en los grupos cargados el avatar nuevo de un alumno"""
+        self._cargas.invalidar(tenant_id)
+        for clave in {(tenant_id, grado), (tenant_id, None)}:
+            grupo = self._grupos.get(clave)
+            alumno = grupo.alumnos.get(alumno_id) if grupo is not None else None
+            if alumno is not None:
+                alumno["profile_image_avatar_url"] = url
+
+    def agregar_alumno(self, usuario: Usuario) -> None:
+        """Incorpora un estudiante recién creado a los grupos cargados de su tenant"""
+        self._cargas.invalidar(usuario.tenant_id)
+        for clave in {(usuario.tenant_id, usuario.grado), (usuario.tenant_id, None)}:
+            grupo = self._grupos.get(clave)
+            if grupo is not None:
+                grupo.agregar({campo: getattr(usuario, campo) for campo in CAMPOS_RANKING})
+
+    def descartar(self, tenant_id: str) -> None:
+        """Olvida los grupos de un tenant; se recargarán en la próxima consulta"""
+        self._cargas.invalidar(tenant_id)
+        for clave in self._grupos.claves():
+            if clave[0] == tenant_id:
+                self._grupos.pop(clave)
+
+    def estadisticas(self) -> dict:
+        return self._grupos.estadisticas()
+
+motor_ranking = MotorRanking()
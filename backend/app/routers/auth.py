@@ -1,41 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List
+import csv
+import io
 from app.database import get_db
-from app.models.usuario import Usuario
-from app.schemas.usuario import UsuarioCreate, UsuarioOut, UsuarioLogin, Token, EstudianteCreateByProfesor, RankingEstudiante
-from app.auth import hash_password, authenticate_user, create_access_token, get_current_profesor
+from app.models.usuario import Usuario, RolEnum
+from app.schemas.usuario import UsuarioCreate, UsuarioOut, UsuarioLogin, Token, EstudianteCreateByProfesor, RankingEstudiante, MiRanking, ImportacionOut
+from app.ranking import motor_ranking, SinGrado
+from app.importacion import importar_estudiantes, IMPORTACION_MAX_FILAS
+from app.versiones import versiones, cabeceras_version, no_modificado
+from app.utils.unicidad import campo_duplicado, emails_generados
+from app.auth import hash_password, authenticate_user, create_access_token, get_current_profesor, get_current_estudiante, Principal
 
 router = APIRouter(prefix="/auth", tags=["Autenticación"])
 
+MENSAJES_DUPLICADO = {
+    "username": "El nombre de usuario ya está registrado",
+    "email": "El email ya está registrado",
+    "dni": "El DNI ya está registrado",
+}
+
+def _error_duplicado(error: IntegrityError, mensajes: dict = MENSAJES_DUPLICADO) -> HTTPException:
+    """Traduce la restricción única violada al mensaje que ya conocen los clientes"""
+    campo = campo_duplicado(error)
+    if campo is None:
+        print(f"[ERROR] Error de integridad inesperado: {error.orig}")
+        return HTTPException(status_code=400, detail="Los datos entran en conflicto con un registro existente")
+    return HTTPException(status_code=400, detail=mensajes[campo])
+
 @router.post("/register", response_model=UsuarioOut)
-def registrar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
+async def registrar_usuario(usuario: UsuarioCreate, db: AsyncSession = Depends(get_db)):
     """Registra un nuevo usuario (estudiante o profesor)"""
     
-    # Verificar si el username ya existe
-    if db.query(Usuario).filter(Usuario.username == usuario.username).first():
-        raise HTTPException(
-            status_code=400,
-            detail="El nombre de usuario ya está registrado"
-        )
-    
-    # Verificar si el email ya existe
-    if db.query(Usuario).filter(Usuario.email == usuario.email).first():
-        raise HTTPException(
-            status_code=400,
-            detail="El email ya está registrado"
-        )
-    
-    # Verificar DNI si es estudiante
-    if usuario.rol.value == "estudiante" and usuario.dni:
-        if db.query(Usuario).filter(Usuario.dni == usuario.dni).first():
-            raise HTTPException(
-                status_code=400,
-                detail="El DNI ya está registrado"
-            )
-    
     # Hashear la contraseña
-    password_hash = hash_password(usuario.password)
+    password_hash = await hash_password(usuario.password)
     
     # Crear el usuario
     nuevo_usuario = Usuario(
@@ -53,17 +52,25 @@ def registrar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
         tenant_id=usuario.tenant_id
     )
     
+    # Inserción optimista: las restricciones únicas deciden si username, email o DNI ya existen
     db.add(nuevo_usuario)
-    db.commit()
-    db.refresh(nuevo_usuario)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise _error_duplicado(e)
+    
+    if nuevo_usuario.rol == RolEnum.ESTUDIANTE:
+        motor_ranking.agregar_alumno(nuevo_usuario)
+        versiones.incrementar("ranking", nuevo_usuario.tenant_id)
     
     return nuevo_usuario
 
 @router.post("/login", response_model=Token)
-def login(user_credentials: UsuarioLogin, db: Session = Depends(get_db)):
+async def login(user_credentials: UsuarioLogin, db: AsyncSession = Depends(get_db)):
     """Autentica un usuario y devuelve un token JWT"""
     
-    user = authenticate_user(db, user_credentials.username, user_credentials.password)
+    user = await authenticate_user(db, user_credentials.username, user_credentials.password)
     
     if not user:
         raise HTTPException(
@@ -72,7 +79,7 @@ def login(user_credentials: UsuarioLogin, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if user.activo != "true":
+    if not user.activo:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario inactivo"
@@ -90,47 +97,13 @@ def login(user_credentials: UsuarioLogin, db: Session = Depends(get_db)):
     }
 
 @router.post("/crear-estudiante", response_model=UsuarioOut)
-def crear_estudiante_por_profesor(
+async def crear_estudiante_por_profesor(
     estudiante: EstudianteCreateByProfesor, 
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_profesor)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_profesor)
 ):
     """Permite a un profesor crear una cuenta de estudiante"""
     
-    # Verificar si el DNI ya existe en usuarios
-    if db.query(Usuario).filter(Usuario.dni == estudiante.dni).first():
-        raise HTTPException(
-            status_code=400,
-            detail="El DNI ya está registrado en usuarios"
-        )
-    
-    # Verificar si el DNI ya existe en estudiantes
-    from app.models.estudiante import Estudiante
-    if db.query(Estudiante).filter(Estudiante.dni == estudiante.dni).first():
-        raise HTTPException(
-            status_code=400,
-            detail="El DNI ya está registrado en estudiantes"
-        )
-    
-    # Verificar si el email ya existe (solo si se proporciona)
-    if estudiante.email and db.query(Usuario).filter(Usuario.email == estudiante.email).first():
-        raise HTTPException(
-            status_code=400,
-            detail="El email ya está registrado"
-        )
-    
-    # Generar email automático si no se proporciona
-    email_final = estudiante.email
-    if not email_final:
-        email_final = f"{estudiante.dni}@estudiante.colegio.edu"
-        # Verificar que el email generado no existe
-        while db.query(Usuario).filter(Usuario.email == email_final).first():
-            import random
-            email_final = f"{estudiante.dni}_{random.randint(1000, 9999)}@estudiante.colegio.edu"
-    
-    # Hashear la contraseña
-    password_hash = hash_password(estudiante.password)
-    
     # Calcular la edad basada en la fecha de nacimiento
     from app.utils.edad_utils import calcular_edad, validar_fecha_nacimiento
     
@@ -142,13 +115,19 @@ def crear_estudiante_por_profesor(
     
     edad_calculada = calcular_edad(estudiante.fecha_nacimiento)
     
-    try:
-        # Crear el estudiante en la tabla usuarios (para autenticación)
+    # Hashear la contraseña
+    password_hash = await hash_password(estudiante.password)
+    
+    # Sin email se usa el automático; si está ocupado, sus alternativas deterministas
+    candidatos = [estudiante.email] if estudiante.email else emails_generados(estudiante.dni)
+    
+    # Inserción optimista: cada intento es una transacción con un único INSERT
+    for email_final in candidatos:
         nuevo_usuario = Usuario(
             username=estudiante.dni,  # DNI como username
             email=email_final,
             password_hash=password_hash,
-            rol="estudiante",
+            rol=RolEnum.ESTUDIANTE,
             nombre=estudiante.nombre,
             apellido=estudiante.apellido,
             dni=estudiante.dni,
@@ -159,76 +138,119 @@ def crear_estudiante_por_profesor(
             sexo=estudiante.sexo,
             tenant_id=current_user.tenant_id  # Mismo tenant que el profesor
         )
-        
         db.add(nuevo_usuario)
-        db.flush()  # Para obtener el ID generado
-        
-        # Crear el estudiante en la tabla estudiantes (para funcionalidad específica)
-        nuevo_estudiante = Estudiante(
-            dni=estudiante.dni,
-            nombre=estudiante.nombre,
-            apellido=estudiante.apellido,
-            fecha_nacimiento=estudiante.fecha_nacimiento,
-            edad=edad_calculada,
-            grado=estudiante.grado,
-            seccion=estudiante.seccion,
-            sexo=estudiante.sexo,
-            correo=email_final,
-            password=estudiante.password,  # Contraseña sin hashear para referencia
-            tenant_id=current_user.tenant_id
+        try:
+            await db.commit()
+            break
+        except IntegrityError as e:
+            await db.rollback()
+            if campo_duplicado(e) == "email" and not estudiante.email:
+                continue
+            # El DNI también es el username del estudiante
+            raise _error_duplicado(e, {**MENSAJES_DUPLICADO,
+                                       "username": "El DNI ya está registrado en usuarios",
+                                       "dni": "El DNI ya está registrado en usuarios"})
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail="No se pudo generar un email libre para el estudiante"
+        )
+    
+    motor_ranking.agregar_alumno(nuevo_usuario)
+    versiones.incrementar("ranking", nuevo_usuario.tenant_id)
+    
+    print(f"[SUCCESS] Estudiante creado - Usuario ID: {nuevo_usuario.id}, DNI: {nuevo_usuario.dni}")
+    
+    return nuevo_usuario
+
+async def _importar(db: AsyncSession, filas: List[Dict[str, Any]], current_user: Principal) -> dict:
+    if not filas:
+        raise HTTPException(status_code=400, detail="El listado está vacío")
+    if len(filas) > IMPORTACION_MAX_FILAS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El listado supera el máximo de {IMPORTACION_MAX_FILAS} estudiantes"
         )
-        
-        db.add(nuevo_estudiante)
-        db.commit()
-        db.refresh(nuevo_usuario)
-        
-        print(f"[SUCCESS] Estudiante creado - Usuario ID: {nuevo_usuario.id}, Estudiante DNI: {nuevo_estudiante.dni}")
-        
-        return nuevo_usuario
-        
-    except Exception as e:
-        db.rollback()
-        print(f"[ERROR] Error al crear estudiante: {e}")
+    
+    try:
+        resultado = await importar_estudiantes(db, filas, current_user)
+    except IntegrityError:
+        # Otro proceso registró alguno de los DNI o emails entre la comprobación y la inserción
+        await db.rollback()
         raise HTTPException(
-            status_code=500,
-            detail=f"Error interno al crear el estudiante: {str(e)}"
+            status_code=409,
+            detail="Algunos estudiantes se registraron mientras tanto; vuelve a enviar el listado"
         )
+    
+    if resultado["creados"]:
+        motor_ranking.descartar(current_user.tenant_id)
+        versiones.incrementar("ranking", current_user.tenant_id)
+    
+    print(f"[SUCCESS] Importación: {resultado['creados']} creados, {resultado['errores']} con errores")
+    
+    return resultado
+
+@router.post("/crear-estudiantes", response_model=ImportacionOut)
+async def crear_estudiantes_por_profesor(
+    estudiantes: List[Dict[str, Any]],
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_profesor)
+):
+    """Crea en bloque las cuentas de una lista de estudiantes (mismos campos que /crear-estudiante)"""
+    
+    return await _importar(db, estudiantes, current_user)
+
+@router.post("/crear-estudiantes/csv", response_model=ImportacionOut)
+async def crear_estudiantes_desde_csv(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_profesor)
+):
+    """Crea en bloque las cuentas de un CSV con cabecera (columnas como en /crear-estudiante)"""
+    
+    try:
+        texto = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar codificado en UTF-8")
+    
+    # Las celdas vacías cuentan como campos no enviados (p. ej. email opcional)
+    filas = [
+        {columna.strip(): valor.strip() for columna, valor in fila.items() if columna and valor and valor.strip()}
+        for fila in csv.DictReader(io.StringIO(texto))
+    ]
+    return await _importar(db, filas, current_user)
 
 @router.get("/ranking", response_model=List[RankingEstudiante])
-def obtener_ranking(
+async def obtener_ranking(
+    request: Request,
+    response: Response,
     materia: str = None,
     grado: str = None,
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_profesor)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_profesor)
 ):
-    """Obtiene el ranking de estudiantes por puntos"""
+    """Obtiene el ranking de estudiantes por puntos (servido desde memoria)"""
     
-    query = db.query(Usuario).filter(
-        Usuario.rol == "estudiante",
-        Usuario.tenant_id == current_user.tenant_id,
-        Usuario.activo == "true"
-    )
+    cabeceras = cabeceras_version(request, "ranking", current_user.tenant_id)
+    if (no_cambio := no_modificado(request, cabeceras)) is not None:
+        return no_cambio
+    response.headers.update(cabeceras)
     
-    if grado:
-        query = query.filter(Usuario.grado == grado)
-    
-    if materia:
-        # Ordenar por materia específica
-        if materia == "matematicas":
-            query = query.order_by(Usuario.puntos_matematicas.desc())
-        elif materia == "comunicacion":
-            query = query.order_by(Usuario.puntos_comunicacion.desc())
-        elif materia == "personal_social":
-            query = query.order_by(Usuario.puntos_personal_social.desc())
-        elif materia == "ciencia_tecnologia":
-            query = query.order_by(Usuario.puntos_ciencia_tecnologia.desc())
-        elif materia == "ingles":
-            query = query.order_by(Usuario.puntos_ingles.desc())
-        else:
-            query = query.order_by(Usuario.puntos_totales.desc())
-    else:
-        # Ordenar por puntos totales
-        query = query.order_by(Usuario.puntos_totales.desc())
+    return await motor_ranking.top(db, current_user.tenant_id, grado or None, materia)
+
+
+@router.get("/mi-ranking", response_model=MiRanking)
+async def obtener_mi_ranking(
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_estudiante)
+):
+    """Obtiene la posición del estudiante actual dentro de su grado, por materia y en general"""
+    
+    try:
+        posicion = await motor_ranking.posicion(db, current_user.tenant_id, current_user.id)
+    except SinGrado:
+        raise HTTPException(status_code=404, detail="No tienes grado asignado; pide a tu profesor que lo registre")
+    if posicion is None:
+        raise HTTPException(status_code=404, detail="No apareces en el ranking")
     
-    estudiantes = query.limit(20).all()  # Top 20
-    return estudiantes
+    return posicion
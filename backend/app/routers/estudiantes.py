@@ -1,24 +1,65 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
-from app import models
-from app.schemas.estudiante import EstudianteOut, EstudianteCreate
+from app.models.usuario import Usuario, RolEnum
+from app.schemas.estudiante import EstudianteOut, EstudianteCreate, PaginaEstudiantes
+from app.utils.paginacion import ParametrosPagina, paginar
+from app.ranking import motor_ranking
+from app.versiones import versiones
+from app.auth import hash_password
+from app.utils.unicidad import campo_duplicado
+from typing import Union
 
 router = APIRouter(prefix="/estudiantes", tags=["Estudiantes"])
 
+# Los estudiantes viven solo en usuarios (rol estudiante); la tabla estudiantes es una vista
+
 @router.post("/", response_model=EstudianteOut)
-def crear_estudiante(estudiante: EstudianteCreate, db: Session = Depends(get_db)):
-    nuevo = models.Estudiante(**estudiante.dict())
+async def crear_estudiante(estudiante: EstudianteCreate, db: AsyncSession = Depends(get_db)):
+    nuevo = Usuario(
+        username=estudiante.dni,  # DNI como username
+        email=estudiante.correo,
+        password_hash=await hash_password(estudiante.password),
+        rol=RolEnum.ESTUDIANTE,
+        nombre=estudiante.nombre,
+        apellido=estudiante.apellido,
+        dni=estudiante.dni,
+        fecha_nacimiento=estudiante.fecha_nacimiento,
+        edad=estudiante.edad,
+        grado=estudiante.grado,
+        seccion=estudiante.seccion,
+        sexo=estudiante.sexo,
+        tenant_id=estudiante.tenant_id
+    )
     db.add(nuevo)
-    db.commit()
-    db.refresh(nuevo)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        campo = campo_duplicado(e)
+        if campo == "email":
+            raise HTTPException(status_code=400, detail="El email ya está registrado")
+        if campo in ("dni", "username"):
+            raise HTTPException(status_code=400, detail="El DNI ya está registrado")
+        raise HTTPException(status_code=400, detail="Los datos entran en conflicto con un registro existente")
+
+    motor_ranking.agregar_alumno(nuevo)
+    versiones.incrementar("ranking", nuevo.tenant_id)
     return nuevo
 
-@router.get("/", response_model=list[EstudianteOut])
-def listar_estudiantes(db: Session = Depends(get_db)):
+@router.get("/", response_model=Union[list[EstudianteOut], PaginaEstudiantes])
+async def listar_estudiantes(pagina: ParametrosPagina = Depends(), db: AsyncSession = Depends(get_db)):
     try:
-        estudiantes = db.query(models.Estudiante).all()
+        consulta = select(Usuario).where(Usuario.rol == RolEnum.ESTUDIANTE)
+        if pagina.activa:
+            return await paginar(db, consulta, Usuario.id, pagina)
+        result = await db.execute(consulta)
+        estudiantes = result.scalars().all()
         return estudiantes
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR en /estudiantes GET]: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {e}")
@@ -1,21 +1,78 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, update, case, literal, true
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Union
 from app.database import get_db
-from app.models.reto import Reto
-from app.models.usuario import Usuario
+from app.models.reto import Reto, MateriaEnum
+from app.models.usuario import Usuario, PUNTOS_POR_MATERIA
 from app.models.progreso_reto import ProgresoReto
-from app.schemas.reto import RetoCreate, RetoOut, CompletarReto, ProgresoRetoOut
-from app.auth import get_current_profesor, get_current_active_user, get_current_estudiante
+from app.schemas.reto import RetoCreate, RetoOut, CompletarReto, ProgresoRetoOut, PaginaRetos, PaginaProgreso, CompletarLoteOut
+from app.utils.paginacion import ParametrosPagina, paginar
+from app.ranking import motor_ranking
+from app.catalogo import catalogo_retos
+from app.versiones import versiones, cabeceras_version, no_modificado
+from app.auth import get_current_profesor, get_current_active_user, get_current_estudiante, Principal
 from sqlalchemy.sql import func
+import json
+import os
 
 router = APIRouter(prefix="/retos", tags=["Retos"])
 
+# Máximo de retos por envío a /retos/completar-lote
+COMPLETAR_LOTE_MAX = int(os.getenv("COMPLETAR_LOTE_MAX", "200"))
+
+def _serializar_retos(retos) -> bytes:
+    """Mismo JSON que generaría FastAPI con response_model=List[RetoOut]"""
+    columnas = [columna.key for columna in Reto.__table__.columns]
+    datos = jsonable_encoder([RetoOut(**{c: getattr(reto, c) for c in columnas}) for reto in retos])
+    return json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _sentencia_completar(estudiante_id: int, reto_id: int, puntos: int):
+    """
+    INSERT ... ON CONFLICT sobre progreso_retos encadenado con el UPDATE de los puntos
+    del usuario. Devuelve el progreso junto con la materia, el tenant y el grado, o
+    ninguna fila si el reto no está activo o ya estaba completado.
+    """
+    reto_activo = select(
+        literal(estudiante_id), Reto.id, true(), literal(puntos), func.now()
+    ).where(Reto.id == reto_id, Reto.activo)
+    upsert = insert(ProgresoReto).from_select(
+        ["estudiante_id", "reto_id", "completado", "puntos_obtenidos", "fecha_completado"], reto_activo
+    )
+    upsert = upsert.on_conflict_do_update(
+        constraint="uq_progreso_retos_estudiante_reto",
+        set_={
+            "completado": True,
+            "puntos_obtenidos": upsert.excluded.puntos_obtenidos,
+            "fecha_completado": upsert.excluded.fecha_completado,
+            "updated_at": func.now(),
+        },
+        where=~ProgresoReto.completado,
+    ).returning(*ProgresoReto.__table__.c)
+    progreso = upsert.cte("progreso")
+
+    # UPDATE sobre la tabla (no la entidad ORM) para que el RETURNING llegue tal cual
+    usuarios = Usuario.__table__
+    puntos_por_materia = {
+        columna: usuarios.c[columna] + case(
+            (Reto.materia == MateriaEnum(materia), progreso.c.puntos_obtenidos), else_=0
+        )
+        for materia, columna in PUNTOS_POR_MATERIA.items()
+    }
+    return (
+        update(usuarios)
+        .where(usuarios.c.id == progreso.c.estudiante_id, Reto.id == progreso.c.reto_id)
+        .values(**puntos_por_materia, puntos_totales=usuarios.c.puntos_totales + progreso.c.puntos_obtenidos)
+        .returning(*progreso.c, Reto.materia, usuarios.c.tenant_id, usuarios.c.grado)
+    )
+
 @router.post("/", response_model=RetoOut)
-def crear_reto(
+async def crear_reto(
     reto: RetoCreate, 
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_profesor)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_profesor)
 ):
     """Crea un nuevo reto (solo profesores)"""
     
@@ -36,8 +93,11 @@ def crear_reto(
         print(f"[DEBUG] Reto creado en memoria: {nuevo_reto}")
         
         db.add(nuevo_reto)
-        db.commit()
-        db.refresh(nuevo_reto)
+        await db.commit()
+        await db.refresh(nuevo_reto)
+        catalogo_retos.invalidar(nuevo_reto.tenant_id, nuevo_reto.materia)
+        versiones.incrementar("retos", nuevo_reto.tenant_id)
+        versiones.incrementar("mis_retos", current_user.id)
         
         print(f"[DEBUG] Reto guardado en BD con ID: {nuevo_reto.id}")
         
@@ -46,50 +106,79 @@ def crear_reto(
     except Exception as e:
         print(f"[ERROR] Error al crear reto: {e}")
         print(f"[ERROR] Tipo de error: {type(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, 
             detail=f"Error interno al crear el reto: {str(e)}"
         )
 
-@router.get("/", response_model=List[RetoOut])
-def listar_retos(
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_active_user)
+@router.get("/", response_model=Union[List[RetoOut], PaginaRetos])
+async def listar_retos(
+    request: Request,
+    response: Response,
+    pagina: ParametrosPagina = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """Lista todos los retos activos"""
     
-    retos = db.query(Reto).filter(
-        Reto.activo == "true",
+    cabeceras = cabeceras_version(request, "retos", current_user.tenant_id)
+    if (no_cambio := no_modificado(request, cabeceras)) is not None:
+        return no_cambio
+    response.headers.update(cabeceras)
+    
+    consulta = select(Reto).where(
+        Reto.activo,
         Reto.tenant_id == current_user.tenant_id
-    ).all()
+    )
+    if pagina.activa:
+        return await paginar(db, consulta, Reto.id, pagina)
     
-    return retos
+    async def cargar() -> bytes:
+        result = await db.execute(consulta)
+        return _serializar_retos(result.scalars().all())
+    
+    cuerpo = await catalogo_retos.obtener(current_user.tenant_id, None, cargar)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
 
-@router.get("/mis-retos", response_model=List[RetoOut])
-def mis_retos(
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_profesor)
+@router.get("/mis-retos", response_model=Union[List[RetoOut], PaginaRetos])
+async def mis_retos(
+    request: Request,
+    response: Response,
+    pagina: ParametrosPagina = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_profesor)
 ):
     """Lista los retos creados por el profesor actual"""
     
-    retos = db.query(Reto).filter(
+    cabeceras = cabeceras_version(request, "mis_retos", current_user.id)
+    if (no_cambio := no_modificado(request, cabeceras)) is not None:
+        return no_cambio
+    response.headers.update(cabeceras)
+    
+    consulta = select(Reto).where(
         Reto.profesor_id == current_user.id,
-        Reto.activo == "true"
-    ).all()
+        Reto.activo
+    )
+    if pagina.activa:
+        return await paginar(db, consulta, Reto.id, pagina)
+    
+    result = await db.execute(consulta)
+    retos = result.scalars().all()
     
     return retos
 
 @router.put("/{reto_id}", response_model=RetoOut)
-def actualizar_reto(
+async def actualizar_reto(
     reto_id: int,
     reto_data: RetoCreate,
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_profesor)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_profesor)
 ):
     """Actualiza un reto (solo el profesor que lo creó)"""
     
-    reto = db.query(Reto).filter(Reto.id == reto_id).first()
+    result = await db.execute(select(Reto).where(Reto.id == reto_id))
+    reto = result.scalars().first()
     
     if not reto:
         raise HTTPException(status_code=404, detail="Reto no encontrado")
@@ -97,6 +186,8 @@ def actualizar_reto(
     if reto.profesor_id != current_user.id:
         raise HTTPException(status_code=403, detail="No puedes modificar este reto")
     
+    materia_anterior = reto.materia
+    
     # Actualizar campos
     reto.titulo = reto_data.titulo
     reto.descripcion = reto_data.descripcion
@@ -104,20 +195,24 @@ def actualizar_reto(
     reto.nivel = reto_data.nivel
     reto.materia = reto_data.materia
     
-    db.commit()
-    db.refresh(reto)
+    await db.commit()
+    await db.refresh(reto)
+    catalogo_retos.invalidar(reto.tenant_id, materia_anterior, reto.materia)
+    versiones.incrementar("retos", reto.tenant_id)
+    versiones.incrementar("mis_retos", current_user.id)
     
     return reto
 
 @router.delete("/{reto_id}")
-def eliminar_reto(
+async def eliminar_reto(
     reto_id: int,
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_profesor)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_profesor)
 ):
     """Elimina un reto (solo el profesor que lo creó)"""
     
-    reto = db.query(Reto).filter(Reto.id == reto_id).first()
+    result = await db.execute(select(Reto).where(Reto.id == reto_id))
+    reto = result.scalars().first()
     
     if not reto:
         raise HTTPException(status_code=404, detail="Reto no encontrado")
@@ -126,94 +221,198 @@ def eliminar_reto(
         raise HTTPException(status_code=403, detail="No puedes eliminar este reto")
     
     # Marcar como inactivo en lugar de eliminar
-    reto.activo = "false"
-    db.commit()
+    reto.activo = False
+    await db.commit()
+    catalogo_retos.invalidar(reto.tenant_id, reto.materia)
+    versiones.incrementar("retos", reto.tenant_id)
+    versiones.incrementar("mis_retos", current_user.id)
     
     return {"message": "Reto eliminado exitosamente"}
 
 @router.post("/completar", response_model=ProgresoRetoOut)
-def completar_reto(
+async def completar_reto(
     datos: CompletarReto,
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_estudiante)
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_estudiante)
 ):
     """Permite a un estudiante completar un reto"""
     
-    # Verificar que el reto existe
-    reto = db.query(Reto).filter(Reto.id == datos.reto_id, Reto.activo == "true").first()
-    if not reto:
-        raise HTTPException(status_code=404, detail="Reto no encontrado")
+    # Ventana de escritura del ranking: una carga en frío que vea ya los puntos no se guarda
+    with motor_ranking.escritura(current_user.tenant_id):
+        # Una sola sentencia: upsert del progreso (solo si aún no estaba completado) y suma
+        # atómica de los puntos en la columna de la materia y en los totales
+        result = await db.execute(_sentencia_completar(current_user.id, datos.reto_id, datos.puntos_obtenidos))
+        fila = result.first()
+        
+        if fila is None:
+            # No se insertó nada: o el reto no existe / está inactivo, o ya estaba completado
+            await db.rollback()
+            result = await db.execute(select(Reto.id).where(Reto.id == datos.reto_id, Reto.activo))
+            if result.first() is None:
+                raise HTTPException(status_code=404, detail="Reto no encontrado")
+            raise HTTPException(status_code=400, detail="Ya completaste este reto")
+        
+        await db.commit()
+        
+        motor_ranking.sumar_puntos(fila.tenant_id, fila.grado, current_user.id, fila.materia, fila.puntos_obtenidos)
+    
+    versiones.incrementar("progreso", current_user.id)
+    versiones.incrementar("ranking", fila.tenant_id)
     
-    # Verificar si ya completó este reto
-    progreso_existente = db.query(ProgresoReto).filter(
-        ProgresoReto.estudiante_id == current_user.id,
-        ProgresoReto.reto_id == datos.reto_id
-    ).first()
-    
-    if progreso_existente and progreso_existente.completado == "true":
-        raise HTTPException(status_code=400, detail="Ya completaste este reto")
-    
-    # Crear o actualizar progreso
-    if progreso_existente:
-        progreso_existente.completado = "true"
-        progreso_existente.puntos_obtenidos = datos.puntos_obtenidos
-        progreso_existente.fecha_completado = func.now()
-        progreso = progreso_existente
-    else:
-        progreso = ProgresoReto(
-            estudiante_id=current_user.id,
-            reto_id=datos.reto_id,
-            completado="true",
-            puntos_obtenidos=datos.puntos_obtenidos,
-            fecha_completado=func.now()
+    return fila
+
+@router.post("/completar-lote", response_model=CompletarLoteOut)
+async def completar_retos_lote(
+    datos: List[CompletarReto],
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_estudiante)
+):
+    """Completa varios retos en una sola transacción (reenvío de sesiones sin conexión)"""
+    
+    if len(datos) > COMPLETAR_LOTE_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No se pueden enviar más de {COMPLETAR_LOTE_MAX} retos a la vez"
         )
-        db.add(progreso)
-    
-    # Actualizar puntos del estudiante según la materia
-    if reto.materia.value == "matematicas":
-        current_user.puntos_matematicas += datos.puntos_obtenidos
-    elif reto.materia.value == "comunicacion":
-        current_user.puntos_comunicacion += datos.puntos_obtenidos
-    elif reto.materia.value == "personal_social":
-        current_user.puntos_personal_social += datos.puntos_obtenidos
-    elif reto.materia.value == "ciencia_tecnologia":
-        current_user.puntos_ciencia_tecnologia += datos.puntos_obtenidos
-    elif reto.materia.value == "ingles":
-        current_user.puntos_ingles += datos.puntos_obtenidos
-    
-    # Actualizar puntos totales
-    current_user.puntos_totales += datos.puntos_obtenidos
-    
-    db.commit()
-    db.refresh(progreso)
     
-    return progreso
+    # Un reto repetido en el lote solo cuenta la primera vez
+    pendientes = {}
+    for item in datos:
+        pendientes.setdefault(item.reto_id, item)
+    
+    # Todos los retos en una consulta
+    materias = {}
+    if pendientes:
+        result = await db.execute(select(Reto.id, Reto.materia).where(Reto.id.in_(pendientes), Reto.activo))
+        materias = dict(result.all())
+    
+    with motor_ranking.escritura(current_user.tenant_id):
+        # Upsert de todo el progreso; solo devuelve las filas que pasan a completadas
+        completados = {}
+        if materias:
+            upsert = insert(ProgresoReto.__table__).values([
+                {
+                    "estudiante_id": current_user.id,
+                    "reto_id": reto_id,
+                    "completado": True,
+                    "puntos_obtenidos": pendientes[reto_id].puntos_obtenidos,
+                    "fecha_completado": func.now(),
+                }
+                for reto_id in materias
+            ])
+            upsert = upsert.on_conflict_do_update(
+                constraint="uq_progreso_retos_estudiante_reto",
+                set_={
+                    "completado": True,
+                    "puntos_obtenidos": upsert.excluded.puntos_obtenidos,
+                    "fecha_completado": upsert.excluded.fecha_completado,
+                    "updated_at": func.now(),
+                },
+                where=~ProgresoReto.completado,
+            ).returning(*ProgresoReto.__table__.c)
+            result = await db.execute(upsert)
+            completados = {fila.reto_id: fila for fila in result.all()}
+        
+        # Deltas sumados por materia en un único UPDATE del estudiante
+        deltas = {}
+        for reto_id, fila in completados.items():
+            columna = PUNTOS_POR_MATERIA[materias[reto_id].value]
+            deltas[columna] = deltas.get(columna, 0) + fila.puntos_obtenidos
+        total = sum(deltas.values())
+        
+        if completados:
+            usuarios = Usuario.__table__
+            result = await db.execute(
+                update(usuarios)
+                .where(usuarios.c.id == current_user.id)
+                .values(
+                    **{columna: usuarios.c[columna] + delta for columna, delta in deltas.items()},
+                    puntos_totales=usuarios.c.puntos_totales + total
+                )
+                .returning(usuarios.c.tenant_id, usuarios.c.grado)
+            )
+            estudiante = result.one()
+            await db.commit()
+            
+            for reto_id, fila in completados.items():
+                motor_ranking.sumar_puntos(estudiante.tenant_id, estudiante.grado, current_user.id, materias[reto_id], fila.puntos_obtenidos)
+            versiones.incrementar("progreso", current_user.id)
+            versiones.incrementar("ranking", estudiante.tenant_id)
+    
+    resultados = []
+    vistos = set()
+    for item in datos:
+        if item.reto_id in vistos:
+            estado = "duplicado"
+        elif item.reto_id not in materias:
+            estado = "no_encontrado"
+        elif item.reto_id in completados:
+            estado = "completado"
+        else:
+            estado = "ya_completado"
+        vistos.add(item.reto_id)
+        fila = completados.get(item.reto_id) if estado == "completado" else None
+        resultados.append({
+            "reto_id": item.reto_id,
+            "estado": estado,
+            "progreso": dict(fila._mapping) if fila is not None else None,
+        })
+    
+    return {"completados": len(completados), "puntos_obtenidos": total, "resultados": resultados}
 
-@router.get("/mi-progreso", response_model=List[ProgresoRetoOut])
-def obtener_mi_progreso(
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_estudiante)
+@router.get("/mi-progreso", response_model=Union[List[ProgresoRetoOut], PaginaProgreso])
+async def obtener_mi_progreso(
+    request: Request,
+    response: Response,
+    pagina: ParametrosPagina = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_estudiante)
 ):
     """Obtiene el progreso del estudiante actual"""
     
-    progreso = db.query(ProgresoReto).filter(
+    cabeceras = cabeceras_version(request, "progreso", current_user.id)
+    if (no_cambio := no_modificado(request, cabeceras)) is not None:
+        return no_cambio
+    response.headers.update(cabeceras)
+    
+    consulta = select(ProgresoReto).where(
         ProgresoReto.estudiante_id == current_user.id
-    ).all()
+    )
+    if pagina.activa:
+        return await paginar(db, consulta, ProgresoReto.id, pagina)
+    
+    result = await db.execute(consulta)
+    progreso = result.scalars().all()
     
     return progreso
 
-@router.get("/por-materia/{materia}", response_model=List[RetoOut])
-def listar_retos_por_materia(
-    materia: str,
-    db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_active_user)
+@router.get("/por-materia/{materia}", response_model=Union[List[RetoOut], PaginaRetos])
+async def listar_retos_por_materia(
+    materia: MateriaEnum,
+    request: Request,
+    response: Response,
+    pagina: ParametrosPagina = Depends(),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """Lista retos filtrados por materia"""
     
-    retos = db.query(Reto).filter(
-        Reto.activo == "true",
+    cabeceras = cabeceras_version(request, "retos", current_user.tenant_id)
+    if (no_cambio := no_modificado(request, cabeceras)) is not None:
+        return no_cambio
+    response.headers.update(cabeceras)
+    
+    consulta = select(Reto).where(
+        Reto.activo,
         Reto.tenant_id == current_user.tenant_id,
         Reto.materia == materia
-    ).all()
+    )
+    if pagina.activa:
+        return await paginar(db, consulta, Reto.id, pagina)
     
-    return retos
+    async def cargar() -> bytes:
+        result = await db.execute(consulta)
+        return _serializar_retos(result.scalars().all())
+    
+    cuerpo = await catalogo_retos.obtener(current_user.tenant_id, materia, cargar)
+    return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, FileResponse
+from app.database import estadisticas_pool, consultas_lentas, DB_CONSULTA_LENTA_MS
+from app.auth import get_current_admin, estadisticas_hash, Principal
+from app.catalogo import catalogo_retos
+from app.imagenes import estadisticas_imagenes
+from app.ranking import motor_ranking
+from app.arranque import arranque
+from app.perfilado import listar_perfiles, ruta_perfil
+
+router = APIRouter(prefix="/sistema", tags=["Sistema"])
+
+@router.get("/pool")
+async def estado_pool(current_user: Principal = Depends(get_current_admin)):
+    """Estadísticas en vivo del pool de conexiones a la base de datos (solo administradores)"""
+    return estadisticas_pool()
+
+@router.get("/consultas-lentas")
+async def listar_consultas_lentas(current_user: Principal = Depends(get_current_admin)):
+    """Últimas consultas SQL que superaron DB_CONSULTA_LENTA_MS, con su plan si se muestreó (solo administradores)"""
+    return {"umbral_ms": DB_CONSULTA_LENTA_MS, "consultas": consultas_lentas.listar()}
+
+@router.get("/hash")
+async def estado_hash(current_user: Principal = Depends(get_current_admin)):
+    """Cola y concurrencia del pool de hashing de contraseñas (solo administradores)"""
+    return estadisticas_hash()
+
+@router.get("/cache")
+async def estado_cache(current_user: Principal = Depends(get_current_admin)):
+    """Aciertos, fallos y desalojos de las caches del catálogo de retos y del ranking (solo administradores)"""
+    return {"catalogo_retos": catalogo_retos.estadisticas(), "ranking": motor_ranking.estadisticas()}
+
+@router.get("/imagenes")
+async def estado_imagenes(current_user: Principal = Depends(get_current_admin)):
+    """Trabajos en curso y errores del pool que genera las variantes de las fotos (solo administradores)"""
+    return estadisticas_imagenes()
+
+@router.get("/listo")
+async def listo():
+    """Readiness: 200 si la base está en la revisión de Alembic del código, 503 si no (sin autenticación)"""
+    esquema = await arranque.estado_esquema()
+    return JSONResponse(
+        status_code=200 if esquema["listo"] else 503,
+        content={"esquema": esquema, "arranque": arranque.tiempos()}
+    )
+
+@router.get("/perfiles")
+async def perfiles(current_user: Principal = Depends(get_current_admin)):
+    """Perfiles guardados con ?perfilar=1 o X-Perfilar: 1, del más reciente al más antiguo (solo administradores)"""
+    return [{**perfil, "url": f"/sistema/perfiles/{perfil['id']}"} for perfil in listar_perfiles()]
+
+@router.get("/perfiles/{perfil_id}")
+async def descargar_perfil(perfil_id: str, current_user: Principal = Depends(get_current_admin)):
+    """Perfil en formato speedscope (se abre en https://www.speedscope.app) (solo administradores)"""
+    ruta = ruta_perfil(perfil_id)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return FileResponse(ruta, media_type="application/json", filename=f"perfil-{perfil_id}.speedscope.json")
@@ -0,0 +1,61 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.models.reto import Reto
+from app.models.progreso_reto import ProgresoReto
+from app.schemas.reto import SyncOut
+from app.auth import get_current_active_user, Principal
+import binascii
+import os
+
+router = APIRouter(prefix="/sync", tags=["Sincronización"])
+
+# Segundos que se solapan con la sincronización anterior: cubren las transacciones que
+# empezaron antes del token (updated_at = now() de su inicio) pero confirmaron después.
+# El cliente puede recibir filas repetidas y debe aplicarlas como upsert por id.
+SYNC_MARGEN = float(os.getenv("SYNC_MARGEN", "30"))
+
+def _codificar_token(momento: datetime) -> str:
+    return urlsafe_b64encode(momento.isoformat().encode()).decode().rstrip("=")
+
+def _decodificar_token(token: str) -> datetime:
+    try:
+        relleno = "=" * (-len(token) % 4)
+        return datetime.fromisoformat(urlsafe_b64decode(token + relleno).decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Token de sincronización inválido")
+
+@router.get("", response_model=SyncOut)
+async def sincronizar(
+    since: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_active_user)
+):
+    """
+    Retos del tenant y progreso propio creados o modificados desde `since`, incluidos los
+    retos desactivados. Sin `since` devuelve el estado completo (solo retos activos).
+    """
+    
+    # Hora del servidor de BD, no la de este proceso, para que el token no dependa del reloj local
+    result = await db.execute(select(func.now()))
+    ahora = result.scalar_one()
+    
+    retos = select(Reto).where(Reto.tenant_id == current_user.tenant_id)
+    progreso = select(ProgresoReto).where(ProgresoReto.estudiante_id == current_user.id)
+    if since is None:
+        retos = retos.where(Reto.activo)
+    else:
+        desde = _decodificar_token(since) - timedelta(seconds=SYNC_MARGEN)
+        retos = retos.where(Reto.updated_at > desde)
+        progreso = progreso.where(ProgresoReto.updated_at > desde)
+    
+    result = await db.execute(retos.order_by(Reto.updated_at, Reto.id))
+    retos_cambiados = result.scalars().all()
+    result = await db.execute(progreso.order_by(ProgresoReto.updated_at, ProgresoReto.id))
+    progreso_cambiado = result.scalars().all()
+    
+    return {"retos": retos_cambiados, "progreso": progreso_cambiado, "token": _codificar_token(ahora)}
@@ -1,28 +1,150 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from app.database import get_db
 from app.models.usuario import Usuario
+from app.imagenes import UPLOAD_DIR, URL_IMAGENES, COLUMNA_POR_VARIANTE, procesar_imagen_perfil, url_variante
+from app.ranking import motor_ranking
+from app.versiones import versiones
+import hashlib
 import os
-from starlette.responses import JSONResponse
+import tempfile
+from starlette.datastructures import UploadFile
+from starlette.responses import JSONResponse, RedirectResponse
 
 router = APIRouter(prefix="/usuarios", tags=["Usuarios"])
 
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '..', '..', 'static', 'profile_images')
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Tamaño máximo de una foto de perfil y tamaño de los bloques con que se copia a disco
+PROFILE_IMAGE_MAX_BYTES = int(os.getenv("PROFILE_IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Margen para las cabeceras multipart al comparar con Content-Length
+MARGEN_MULTIPART = 16 * 1024
 
-@router.post("/{user_id}/profile-image")
-def upload_profile_image(user_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
-    user = db.query(Usuario).filter(Usuario.id == user_id).first()
+# El formulario se lee a mano en el handler (sin File(...)), así que se documenta aquí
+FORMULARIO_IMAGEN = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+def _extension_por_contenido(cabecera: bytes) -> Optional[str]:
+    """Extensión según los primeros bytes del archivo (no se confía en el nombre ni en el content-type)"""
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if cabecera[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+def _demasiado_grande() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"La imagen supera el tamaño máximo de {PROFILE_IMAGE_MAX_BYTES // (1024 * 1024)} MB"
+    )
+
+async def _guardar_imagen(file: UploadFile) -> str:
+    """
+    Copia la imagen por bloques a un temporal en el mismo directorio (para que el rename sea
+    atómico), calculando el hash y comprobando el tamaño y el tipo sobre la marcha. Devuelve
+    el nombre final, derivado del contenido.
+    """
+    temporal = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, prefix=".subida-", delete=False)
+    try:
+        sha256 = hashlib.sha256()
+        cabecera = b""
+        total = 0
+        with temporal:
+            while bloque := await file.read(UPLOAD_CHUNK_BYTES):
+                total += len(bloque)
+                if total > PROFILE_IMAGE_MAX_BYTES:
+                    raise _demasiado_grande()
+                if len(cabecera) < 12:
+                    cabecera += bloque[:12 - len(cabecera)]
+                    if len(cabecera) >= 12 and _extension_por_contenido(cabecera) is None:
+                        raise HTTPException(status_code=415, detail="El archivo no es una imagen JPEG, PNG, GIF o WEBP")
+                sha256.update(bloque)
+                await run_in_threadpool(temporal.write, bloque)
+
+        ext = _extension_por_contenido(cabecera)
+        if ext is None:
+            raise HTTPException(status_code=415, detail="El archivo no es una imagen JPEG, PNG, GIF o WEBP")
+
+        # Nombre por contenido: la misma imagen siempre produce el mismo archivo
+        filename = f"{sha256.hexdigest()}{ext}"
+        os.chmod(temporal.name, 0o644)  # NamedTemporaryFile lo crea con permisos 0600
+        os.replace(temporal.name, os.path.join(UPLOAD_DIR, filename))
+        return filename
+    finally:
+        if os.path.exists(temporal.name):
+            os.unlink(temporal.name)
+
+@router.post("/{user_id}/profile-image", openapi_extra=FORMULARIO_IMAGEN)
+async def upload_profile_image(
+    user_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    # El límite se comprueba antes de leer el cuerpo: al parsear el multipart Starlette vuelca
+    # la parte del archivo entera a un temporal, así que con un parámetro File(...) el cuerpo
+    # ya estaría en disco al llegar aquí. El servidor corta cualquier cuerpo que exceda su
+    # Content-Length, por lo que exigirlo acota lo que se llega a leer.
+    longitud = request.headers.get("content-length")
+    if longitud is None or not longitud.isdigit():
+        raise HTTPException(status_code=411, detail="Falta la cabecera Content-Length")
+    if int(longitud) > PROFILE_IMAGE_MAX_BYTES + MARGEN_MULTIPART:
+        raise _demasiado_grande()
+
+    result = await db.execute(select(Usuario).where(Usuario.id == user_id))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    # Guardar archivo
-    ext = os.path.splitext(file.filename)[1]
-    filename = f"user_{user_id}{ext}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    with open(file_path, "wb") as f:
-        f.write(file.file.read())
+
+    async with request.form(max_files=1) as form:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=422, detail="Falta el archivo de la imagen (campo 'file')")
+        filename = await _guardar_imagen(file)
+
     # URL pública (ajusta según tu server)
-    url = f"/static/profile_images/{filename}"
+    url = f"{URL_IMAGENES}/{filename}"
     user.profile_image_url = url
-    db.commit()
+    # Las variantes de la foto anterior dejan de valer; hasta que estén las nuevas se sirve el original
+    for columna in COLUMNA_POR_VARIANTE.values():
+        setattr(user, columna, None)
+    await db.commit()
+    motor_ranking.actualizar_avatar(user.tenant_id, user.grado, user.id, None)
+    versiones.incrementar("ranking", user.tenant_id)
+
+    # Avatar y tamaño medio se generan después de responder, en el pool de imágenes
+    background_tasks.add_task(procesar_imagen_perfil, user.id, filename)
     return JSONResponse(content={"profile_image_url": url})
+
+@router.get("/{user_id}/profile-image")
+async def obtener_profile_image(user_id: int, variante: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """Redirige a la foto de perfil en el tamaño pedido (avatar, medium u original)"""
+    if variante not in (None, "original", *COLUMNA_POR_VARIANTE):
+        raise HTTPException(status_code=400, detail="Variante no válida: usa avatar, medium u original")
+    result = await db.execute(select(Usuario).where(Usuario.id == user_id))
+    user = result.scalars().first()
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    url = url_variante(user, variante)
+    if not url:
+        raise HTTPException(status_code=404, detail="El usuario no tiene foto de perfil")
+    # La redirección cambia al subir otra foto o al terminar las variantes; el destino no
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-cache"})
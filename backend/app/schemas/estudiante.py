@@ -1,5 +1,5 @@
 from pydantic import BaseModel, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import date
 
 
@@ -13,7 +13,6 @@ class EstudianteBase(BaseModel):
     seccion: str
     sexo: str
     correo: str
-    password: str
     tenant_id: str 
 
     @validator('edad', always=True)
@@ -25,10 +24,26 @@ class EstudianteBase(BaseModel):
         return v
 
 class EstudianteCreate(EstudianteBase):
-    pass
+    password: str
 
-class EstudianteOut(EstudianteBase):
+# Se lee de usuarios: los estudiantes dados de alta con /auth/register pueden no tener
+# fecha de nacimiento, grado, sección ni sexo. La contraseña nunca se devuelve.
+class EstudianteOut(BaseModel):
     id: int
+    dni: str
+    nombre: str
+    apellido: str
+    fecha_nacimiento: Optional[date] = None
+    edad: Optional[int] = None
+    grado: Optional[str] = None
+    seccion: Optional[str] = None
+    sexo: Optional[str] = None
+    correo: str
+    tenant_id: str
 
     class Config:
         orm_mode = True
+
+class PaginaEstudiantes(BaseModel):
+    items: List[EstudianteOut]
+    next_cursor: Optional[str] = None
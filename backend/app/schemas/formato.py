@@ -0,0 +1,15 @@
+from datetime import datetime
+
+# Conversores para mantener el formato JSON que ya espera la app Flutter
+
+def bool_a_texto(valor):
+    """Las columnas booleanas se siguen enviando como "true"/"false" """
+    if isinstance(valor, bool):
+        return "true" if valor else "false"
+    return valor
+
+def fecha_a_texto(valor):
+    """Las fechas se envían como texto ISO 8601"""
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, validator
+from typing import List, Optional
 from app.models.reto import MateriaEnum, NivelEnum
+from app.schemas.formato import bool_a_texto, fecha_a_texto
 
 class RetoBase(BaseModel):
     titulo: str
@@ -18,6 +19,10 @@ class RetoOut(RetoBase):
     profesor_id: int
     activo: str
     
+    @validator('activo', pre=True)
+    def activo_como_texto(cls, v):
+        return bool_a_texto(v)
+    
     class Config:
         orm_mode = True
 
@@ -34,5 +39,53 @@ class ProgresoRetoOut(BaseModel):
     puntos_obtenidos: int
     fecha_completado: Optional[str] = None
     
+    @validator('completado', pre=True)
+    def completado_como_texto(cls, v):
+        return bool_a_texto(v)
+    
+    @validator('fecha_completado', pre=True)
+    def fecha_como_texto(cls, v):
+        return fecha_a_texto(v)
+    
     class Config:
         orm_mode = True
+
+# Páginas para la paginación por cursor (?limit=&after=)
+class PaginaRetos(BaseModel):
+    items: List[RetoOut]
+    next_cursor: Optional[str] = None
+
+class PaginaProgreso(BaseModel):
+    items: List[ProgresoRetoOut]
+    next_cursor: Optional[str] = None
+
+# Esquemas para completar varios retos de una vez (sesiones sin conexión)
+class ResultadoCompletar(BaseModel):
+    reto_id: int
+    estado: str  # "completado", "ya_completado", "no_encontrado" o "duplicado"
+    progreso: Optional[ProgresoRetoOut] = None
+
+class CompletarLoteOut(BaseModel):
+    completados: int
+    puntos_obtenidos: int
+    resultados: List[ResultadoCompletar]
+
+# Esquemas de /sync: incluyen los retos desactivados (activo "false") para que el cliente los borre
+class RetoSync(RetoOut):
+    updated_at: Optional[str] = None
+    
+    @validator('updated_at', pre=True)
+    def updated_at_como_texto(cls, v):
+        return fecha_a_texto(v)
+
+class ProgresoRetoSync(ProgresoRetoOut):
+    updated_at: Optional[str] = None
+    
+    @validator('updated_at', pre=True)
+    def updated_at_como_texto(cls, v):
+        return fecha_a_texto(v)
+
+class SyncOut(BaseModel):
+    retos: List[RetoSync]
+    progreso: List[ProgresoRetoSync]
+    token: str
@@ -1,7 +1,8 @@
 from pydantic import BaseModel, EmailStr, validator
-from typing import Optional
+from typing import List, Optional
 from datetime import date
 from app.models.usuario import RolEnum
+from app.schemas.formato import bool_a_texto
 
 class UsuarioBase(BaseModel):
     username: str
@@ -39,6 +40,12 @@ class UsuarioOut(UsuarioBase):
     puntos_ciencia_tecnologia: int = 0
     puntos_ingles: int = 0
     puntos_totales: int = 0
+    profile_image_avatar_url: Optional[str] = None
+    profile_image_medium_url: Optional[str] = None
+    
+    @validator('activo', pre=True)
+    def activo_como_texto(cls, v):
+        return bool_a_texto(v)
     
     class Config:
         orm_mode = True
@@ -79,8 +86,9 @@ class RankingEstudiante(BaseModel):
     id: int
     nombre: str
     apellido: str
-    grado: str
-    seccion: str
+    grado: Optional[str] = None  # los registrados con /auth/register pueden no tenerlos
+    seccion: Optional[str] = None
+    profile_image_avatar_url: Optional[str] = None
     puntos_totales: int
     puntos_matematicas: int
     puntos_comunicacion: int
@@ -90,3 +98,34 @@ class RankingEstudiante(BaseModel):
     
     class Config:
         orm_mode = True
+
+
+# Esquemas para la posición personal en el ranking
+class PosicionRanking(BaseModel):
+    materia: str  # "general" para los puntos totales
+    puntos: int
+    posicion: int
+    total: int
+    percentil: float
+    anterior: Optional[RankingEstudiante] = None
+    siguiente: Optional[RankingEstudiante] = None
+
+class MiRanking(BaseModel):
+    grado: str
+    general: PosicionRanking
+    materias: List[PosicionRanking]
+
+
+# Esquemas para la importación masiva de estudiantes
+class ResultadoImportacion(BaseModel):
+    fila: int  # posición en el JSON o línea de datos del CSV, empezando en 1
+    dni: Optional[str] = None
+    estado: str  # "creado" o "error"
+    id: Optional[int] = None
+    email: Optional[str] = None
+    error: Optional[str] = None
+
+class ImportacionOut(BaseModel):
+    creados: int
+    errores: int
+    resultados: List[ResultadoImportacion]
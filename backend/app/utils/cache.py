@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, Optional
+import asyncio
+import time
+
+class CacheLRU:
+    """
+    Cache en memoria con desalojo LRU y expiración opcional por antigüedad.
+    Es local a cada proceso: con varios workers cada uno mantiene su propia copia,
+    por eso conviene usar un ttl que acote cuánto puede durar un dato obsoleto.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def get(self, clave: Hashable, default: Any = None) -> Any:
+        entrada = self._datos.get(clave)
+        if entrada is None:
+            self.fallos += 1
+            return default
+        valor, expira = entrada
+        if expira is not None and expira < time.monotonic():
+            del self._datos[clave]
+            self.fallos += 1
+            return default
+        self._datos.move_to_end(clave)
+        self.aciertos += 1
+        return valor
+
+    def set(self, clave: Hashable, valor: Any) -> None:
+        expira = time.monotonic() + self.ttl if self.ttl else None
+        self._datos[clave] = (valor, expira)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.maxsize:
+            self._datos.popitem(last=False)
+            self.desalojos += 1
+
+    def pop(self, clave: Hashable) -> None:
+        self._datos.pop(clave, None)
+
+    def claves(self) -> list:
+        """Copia de las claves guardadas (incluidas las caducadas que aún no se han desalojado)"""
+        return list(self._datos)
+
+    def clear(self) -> None:
+        self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def estadisticas(self) -> dict:
+        return {
+            "entradas": len(self._datos),
+            "maxsize": self.maxsize,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+        }
+
+class CargaUnica:
+    """
+    Carga bajo demanda de las entradas de una CacheLRU con un solo lector por clave: las
+    peticiones que llegan mientras otra ya consulta la BD esperan su resultado.
+
+    Cada entrada pertenece a un ámbito (p. ej. el tenant) con un contador de generaciones.
+    Una carga solo se guarda si en su ámbito no hubo escrituras mientras se ejecutaba ni
+    queda alguna abierta: su SELECT pudo leer un estado a medio aplicar.
+    """
+
+    def __init__(self, cache: CacheLRU):
+        self.cache = cache
+        # Solo mientras dura una carga: cada entrada se retira al terminar
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._generaciones: Dict[Hashable, int] = {}
+        self._escrituras: Dict[Hashable, int] = {}
+
+    async def obtener(
+        self,
+        clave: Hashable,
+        ambito: Hashable,
+        cargar: Callable[[], Awaitable[Any]],
+        guardar_si: Callable[[Any], bool] = lambda valor: True,
+    ) -> Any:
+        valor = self.cache.get(clave)
+        if valor is not None:
+            return valor
+        lock = self._locks.setdefault(clave, asyncio.Lock())
+        try:
+            async with lock:
+                valor = self.cache.get(clave)
+                if valor is not None:
+                    return valor
+                generacion = self._generaciones.get(ambito, 0)
+                valor = await cargar()
+                if (self._generaciones.get(ambito, 0) == generacion
+                        and ambito not in self._escrituras and guardar_si(valor)):
+                    self.cache.set(clave, valor)
+                return valor
+        finally:
+            if self._locks.get(clave) is lock:
+                del self._locks[clave]
+
+    def invalidar(self, ambito: Hashable) -> None:
+        """Las cargas del ámbito que estén en curso no guardarán su resultado"""
+        self._generaciones[ambito] = self._generaciones.get(ambito, 0) + 1
+
+    @contextmanager
+    def escritura(self, ambito: Hashable) -> Iterator[None]:
+        """
+        Envuelve una escritura en la BD y su reflejo en la cache (commit y después la
+        actualización en memoria): ninguna carga del ámbito que se solape con ella se guarda.
+        """
+        self.invalidar(ambito)
+        self._escrituras[ambito] = self._escrituras.get(ambito, 0) + 1
+        try:
+            yield
+        finally:
+            self._escrituras[ambito] -= 1
+            if not self._escrituras[ambito]:
+                del self._escrituras[ambito]
@@ -0,0 +1,55 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Optional
+from fastapi import HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+import binascii
+
+PAGINA_POR_DEFECTO = 50
+PAGINA_MAXIMA = 200
+
+def codificar_cursor(ultimo_id: int) -> str:
+    """Cursor opaco a partir del último id devuelto"""
+    return urlsafe_b64encode(str(ultimo_id).encode()).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str) -> int:
+    """Recupera el id de un cursor generado por codificar_cursor"""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        return int(urlsafe_b64decode(cursor + relleno).decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+class ParametrosPagina:
+    """
+    Parámetros opcionales de paginación por cursor. Sin limit ni after el endpoint
+    mantiene la respuesta antigua (lista completa) para los clientes actuales.
+    """
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=PAGINA_MAXIMA),
+        after: Optional[str] = Query(None),
+    ):
+        self.limit = limit
+        self.after = after
+
+    @property
+    def activa(self) -> bool:
+        return self.limit is not None or self.after is not None
+
+async def paginar(db: AsyncSession, consulta, columna, pagina: ParametrosPagina) -> dict:
+    """
+    Ejecuta la consulta ordenada por `columna` (clave única y creciente, normalmente el id)
+    y devuelve una página con el cursor de la siguiente, o None si no hay más filas.
+    """
+    limite = pagina.limit or PAGINA_POR_DEFECTO
+    if pagina.after is not None:
+        consulta = consulta.where(columna > decodificar_cursor(pagina.after))
+    # Una fila de más indica si existe una página siguiente sin hacer un COUNT
+    result = await db.execute(consulta.order_by(columna).limit(limite + 1))
+    filas = result.scalars().all()
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor(getattr(filas[-1], columna.key))
+    return {"items": filas, "next_cursor": siguiente}
@@ -0,0 +1,38 @@
+from typing import List, Optional
+from sqlalchemy.exc import IntegrityError
+import re
+
+DOMINIO_EMAIL_ESTUDIANTES = "estudiante.colegio.edu"
+# Alternativas {dni}_N@... que se prueban si el email generado ya está ocupado
+ALTERNATIVAS_EMAIL = 9
+
+# Campo de usuarios asociado a cada restricción única. Los nombres dependen de cómo se creó
+# la tabla: la migración inicial genera restricciones usuarios_*_key y create_all genera
+# índices únicos ix_usuarios_* para las columnas con index=True.
+CAMPO_POR_RESTRICCION = {
+    "usuarios_username_key": "username",
+    "ix_usuarios_username": "username",
+    "usuarios_email_key": "email",
+    "ix_usuarios_email": "email",
+    "usuarios_dni_key": "dni",
+}
+
+def emails_generados(dni: str) -> List[str]:
+    """Email automático de un estudiante y sus alternativas deterministas, en orden de preferencia"""
+    return [f"{dni}@{DOMINIO_EMAIL_ESTUDIANTES}"] + [
+        f"{dni}_{n}@{DOMINIO_EMAIL_ESTUDIANTES}" for n in range(1, ALTERNATIVAS_EMAIL + 1)
+    ]
+
+def _nombre_restriccion(error: IntegrityError) -> Optional[str]:
+    # asyncpg expone constraint_name en la excepción original (la causa del error adaptado);
+    # psycopg2 lo hace en diag
+    for candidato in (error.orig, getattr(error.orig, "__cause__", None)):
+        nombre = getattr(candidato, "constraint_name", None) or getattr(getattr(candidato, "diag", None), "constraint_name", None)
+        if nombre:
+            return nombre
+    coincidencia = re.search(r'constraint "([^"]+)"', str(error.orig))
+    return coincidencia.group(1) if coincidencia else None
+
+def campo_duplicado(error: IntegrityError) -> Optional[str]:
+    """Campo de usuarios cuyo valor ya existía ("username", "email" o "dni"), o None si es otro error"""
+    return CAMPO_POR_RESTRICCION.get(_nombre_restriccion(error))
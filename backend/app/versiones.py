@@ -0,0 +1,55 @@
+from typing import Dict, Hashable, Optional, Tuple
+from uuid import uuid4
+from fastapi import Request, Response
+import hashlib
+import os
+import time
+
+# Segundos de validez máxima de un ETag. Los contadores son locales a cada worker, así que
+# un cambio hecho en otro proceso (o directamente en la BD) no los incrementa: pasado este
+# intervalo el ETag cambia igualmente y el cliente vuelve a descargar. 0 = sin límite.
+VERSIONES_TTL = float(os.getenv("VERSIONES_TTL", "60"))
+
+class Versiones:
+    """
+    Contadores de versión por (recurso, ámbito), donde el ámbito suele ser el tenant o el
+    usuario. Las escrituras los incrementan y los GET los usan para construir el ETag.
+    """
+
+    def __init__(self):
+        # Identifica al proceso: un ETag emitido por otro worker o antes de un reinicio nunca coincide
+        self._arranque = uuid4().hex[:8]
+        self._contadores: Dict[Tuple[str, Hashable], int] = {}
+
+    def incrementar(self, recurso: str, ambito: Hashable) -> None:
+        clave = (recurso, ambito)
+        self._contadores[clave] = self._contadores.get(clave, 0) + 1
+
+    def etiqueta(self, recurso: str, ambito: Hashable, variante: str = "") -> str:
+        """ETag débil para la versión actual; `variante` distingue parámetros de la consulta"""
+        version = self._contadores.get((recurso, ambito), 0)
+        periodo = int(time.time() // VERSIONES_TTL) if VERSIONES_TTL > 0 else 0
+        huella = hashlib.sha1(f"{recurso}|{ambito}|{variante}".encode()).hexdigest()[:12]
+        return f'W/"{self._arranque}-{version}-{periodo}-{huella}"'
+
+versiones = Versiones()
+
+def cabeceras_version(request: Request, recurso: str, ambito: Hashable) -> Dict[str, str]:
+    """ETag de la versión actual del recurso (distinto por cada query string) y su Cache-Control"""
+    return {
+        "ETag": versiones.etiqueta(recurso, ambito, request.url.query),
+        "Cache-Control": "private, no-cache",
+    }
+
+def no_modificado(request: Request, cabeceras: Dict[str, str]) -> Optional[Response]:
+    """
+    Si el If-None-Match del cliente coincide con el ETag devuelve el 304 que el handler
+    debe retornar antes de consultar la base de datos; si no, None.
+    """
+    recibidas = request.headers.get("if-none-match")
+    if not recibidas:
+        return None
+    etiquetas = {etiqueta.strip() for etiqueta in recibidas.split(",")}
+    if "*" in etiquetas or cabeceras["ETag"] in etiquetas:
+        return Response(status_code=304, headers=cabeceras)
+    return None
@@ -1,6 +1,30 @@
+import asyncio
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
 from app.database import Base, engine
-from app.models import estudiante  # <-- Importa el modelo aquí
+from app.arranque import ALEMBIC_INI
+from app import models  # <-- Registra todos los modelos en Base.metadata
+
+# Solo para bases nuevas de desarrollo; en producción el esquema se gestiona con `alembic upgrade head`
+
+# Migración que sustituye la tabla estudiantes por una vista sobre usuarios
+REVISION_VISTA_ESTUDIANTES = "5f1c0d7e2b94"
+
+def _crear_y_marcar(conn):
+    scripts = ScriptDirectory.from_config(Config(ALEMBIC_INI))
+    Base.metadata.create_all(conn)
+    # La vista no es un modelo: se crea con la misma sentencia que su migración
+    conn.exec_driver_sql(scripts.get_revision(REVISION_VISTA_ESTUDIANTES).module.VISTA_ESTUDIANTES)
+    # El esquema queda como en la última migración: se marca la base en esa revisión
+    # para que la comprobación de arranque la dé por buena y las migraciones futuras apliquen
+    MigrationContext.configure(conn).stamp(scripts, "heads")
+
+async def crear_tablas():
+    async with engine.begin() as conn:
+        await conn.run_sync(_crear_y_marcar)
+    await engine.dispose()
 
 print("Creando tablas en la base de datos...")
-Base.metadata.create_all(bind=engine)
-print("¡Tablas creadas!")
\ No newline at end of file
+asyncio.run(crear_tablas())
+print("¡Tablas creadas!")
@@ -1,14 +1,31 @@
-from fastapi import FastAPI
+import time
+INICIO_IMPORTACION = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.routers import estudiantes, auth, retos
-from app.routers import usuarios
-from app.database import Base, engine
-from app.models import estudiante, usuario, reto  
+from app.routers import usuarios, sistema, sync
+from app.database import engine, MiddlewareConsultas
+from app.arranque import arranque, MedirPrimeraRespuesta
+from app.imagenes import cerrar_imagenes, UPLOAD_DIR, URL_IMAGENES
+from app.media import MediaEstatica
+from app.metricas import metricas, MiddlewareMetricas, METRICAS_TOKEN
+from app.perfilado import MiddlewarePerfilado
+from app.models import usuario, reto, progreso_reto
 
-print("Creando tablas en la base de datos...")
-Base.metadata.create_all(bind=engine)
-print("¡Tablas creadas!")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Las tablas se crean con `alembic upgrade head` antes de desplegar, no al arrancar;
+    # aquí solo se comprueba en segundo plano que la base está en la revisión esperada
+    inicio = time.perf_counter()
+    arranque.comprobar_esquema()
+    arranque.listo_para_servir(inicio)
+    yield
+    cerrar_imagenes()
+    await engine.dispose()
 
 # ✅ Instancia de la app FastAPI
 app = FastAPI(
@@ -17,7 +34,8 @@ app = FastAPI(
     version="1.0.0",
     developers=["Adrian Ruiz <adrianalejandroruiz19@gmail.com>",
                 "Luis Abad <rluisabad@gmail.com>",
-                "Diogo Sandoval <diogo.sandoval@gmail.com>"]
+                "Diogo Sandoval <diogo.sandoval@gmail.com>"],
+    lifespan=lifespan
 )
 
 # ✅ Configurar CORS para permitir peticiones desde Flutter u otros orígenes
@@ -29,13 +47,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MedirPrimeraRespuesta)
+# ✅ Perfilado bajo demanda de una petición (?perfilar=1 con token de administrador)
+app.add_middleware(MiddlewarePerfilado)
+# ✅ Conteo de consultas SQL por petición (cabeceras X-DB-* con DB_DEBUG_CONSULTAS=true)
+app.add_middleware(MiddlewareConsultas)
+# ✅ Métricas por ruta (lo más externo posible para medir también CORS)
+app.add_middleware(MiddlewareMetricas)
+
 # ✅ Incluir las rutas del router de estudiantes
 app.include_router(estudiantes.router)
 app.include_router(auth.router)
 app.include_router(retos.router)
 app.include_router(usuarios.router)
+app.include_router(sistema.router)
+app.include_router(sync.router)
+
+# ✅ Fotos de perfil subidas (en producción conviene que las sirva directamente el proxy o una CDN)
+app.mount(URL_IMAGENES, MediaEstatica(directory=UPLOAD_DIR), name="profile_images")
+
+# ✅ Métricas en formato Prometheus (por worker)
+@app.get("/metrics", include_in_schema=False)
+def exportar_metricas(request: Request):
+    if METRICAS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICAS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
 
 # ✅ Ruta base de prueba
 @app.get("/")
 def read_root():
     return {"mensaje": "API funcionando correctamente"}
+
+arranque.importacion_terminada(INICIO_IMPORTACION)
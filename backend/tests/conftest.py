@@ -0,0 +1,102 @@
+"""
+Fixtures comunes de las pruebas de la API.
+
+Necesitan un PostgreSQL propio: TEST_DATABASE_URL=postgresql://usuario@host/pruebas
+(el esquema public de esa base se borra y se recrea al empezar). Sin la variable se omiten.
+"""
+import asyncio
+import os
+import pytest
+from contextlib import contextmanager
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+# app.database crea el engine al importarse: tiene que ver la URL de pruebas
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "postgresql://localhost/sin_base_de_pruebas"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from app import models  # Registra todos los modelos en Base.metadata
+from app.auth import _principales
+from app.catalogo import catalogo_retos
+from app.database import Base, _url_asincrona, contar_consultas
+from app.ranking import motor_ranking
+
+TENANT = "default"
+
+async def _ejecutar(*sentencias: str, crear_tablas: bool = False) -> list:
+    # Engine aparte, sin pool: el de la app vive en el bucle de eventos del TestClient
+    engine = create_async_engine(_url_asincrona(TEST_DATABASE_URL), poolclass=NullPool)
+    filas = []
+    async with engine.begin() as conn:
+        for sentencia in sentencias:
+            result = await conn.execute(text(sentencia))
+            filas = result.all() if result.returns_rows else []
+        if crear_tablas:
+            await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+    return filas
+
+def ejecutar_sql(*sentencias: str) -> list:
+    """Ejecuta las sentencias en una transacción y devuelve las filas de la última"""
+    return asyncio.run(_ejecutar(*sentencias))
+
+@pytest.fixture(scope="session")
+def cliente():
+    if not TEST_DATABASE_URL:
+        pytest.skip("Define TEST_DATABASE_URL (PostgreSQL) para ejecutar las pruebas de la API")
+    asyncio.run(_ejecutar("DROP SCHEMA public CASCADE", "CREATE SCHEMA public", crear_tablas=True))
+    import main
+    with TestClient(main.app) as c:
+        yield c
+
+@pytest.fixture
+def api(cliente):
+    """Cliente con la base vacía y sin nada en las caches en memoria"""
+    ejecutar_sql("TRUNCATE usuarios, retos, progreso_retos RESTART IDENTITY CASCADE")
+    _principales.clear()
+    motor_ranking.descartar(TENANT)
+    catalogo_retos.invalidar(TENANT)
+    return cliente
+
+@pytest.fixture
+def crear_usuario(api):
+    """Registra un usuario y devuelve las cabeceras con su token"""
+    def crear(username: str, rol: str = "profesor", **campos) -> dict:
+        datos = {
+            "username": username,
+            "email": f"{username}@colegio.edu",
+            "nombre": username.capitalize(),
+            "apellido": "Prueba",
+            "rol": rol,
+            "dni": campos.pop("dni", username),
+            "password": "clave",
+            **campos,
+        }
+        respuesta = api.post("/auth/register", json=datos)
+        assert respuesta.status_code == 200, respuesta.text
+        login = api.post("/auth/login", json={"username": username, "password": "clave"})
+        return {"Authorization": f"Bearer {login.json()['access_token']}"}
+    return crear
+
+@pytest.fixture
+def profesor(crear_usuario):
+    return crear_usuario("profe", "profesor")
+
+@pytest.fixture
+def presupuesto_consultas():
+    """
+    Falla si el bloque ejecuta más consultas SQL de las indicadas:
+
+        with presupuesto_consultas(2):
+            api.post("/retos/completar", ...)
+    """
+    @contextmanager
+    def presupuesto(maximo: int):
+        with contar_consultas() as consultas:
+            yield consultas
+        assert consultas.total <= maximo, (
+            f"{consultas.total} consultas, presupuesto {maximo}: {consultas.sentencias.most_common()}"
+        )
+    return presupuesto
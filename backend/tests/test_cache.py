@@ -0,0 +1,63 @@
+"""CargaUnica: un solo lector por clave y nada de guardar cargas que se solapan con escrituras"""
+import asyncio
+from app.utils.cache import CacheLRU, CargaUnica
+
+def test_un_solo_lector_por_clave():
+    cargas = CargaUnica(CacheLRU(maxsize=10))
+    lecturas = []
+
+    async def cargar():
+        lecturas.append(1)
+        await asyncio.sleep(0.01)
+        return "valor"
+
+    async def escenario():
+        return await asyncio.gather(*[cargas.obtener("clave", "tenant", cargar) for _ in range(5)])
+
+    assert asyncio.run(escenario()) == ["valor"] * 5
+    assert len(lecturas) == 1
+    assert cargas.cache.get("clave") == "valor"
+    assert cargas._locks == {}
+
+def test_carga_que_termina_antes_de_cerrar_la_escritura_no_se_guarda():
+    # La carga lee el estado ya confirmado mientras la escritura aún no ha aplicado su
+    # cambio en memoria: guardarla haría que ese cambio se aplicase dos veces
+    cargas = CargaUnica(CacheLRU(maxsize=10))
+
+    async def cargar():
+        return "con los puntos ya confirmados"
+
+    async def escenario():
+        with cargas.escritura("tenant"):
+            valor = await cargas.obtener("clave", "tenant", cargar)
+        return valor
+
+    assert asyncio.run(escenario()) == "con los puntos ya confirmados"
+    assert cargas.cache.get("clave") is None
+    assert cargas._escrituras == {}
+
+def test_carga_durante_la_que_empieza_una_escritura_no_se_guarda():
+    cargas = CargaUnica(CacheLRU(maxsize=10))
+
+    async def cargar():
+        with cargas.escritura("tenant"):
+            pass
+        return "valor"
+
+    asyncio.run(cargas.obtener("clave", "tenant", cargar))
+
+    assert cargas.cache.get("clave") is None
+
+def test_escritura_de_otro_ambito_no_afecta():
+    cargas = CargaUnica(CacheLRU(maxsize=10))
+
+    async def cargar():
+        return "valor"
+
+    async def escenario():
+        with cargas.escritura("otro"):
+            await cargas.obtener("clave", "tenant", cargar)
+
+    asyncio.run(escenario())
+
+    assert cargas.cache.get("clave") == "valor"
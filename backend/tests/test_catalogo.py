@@ -0,0 +1,20 @@
+"""Cache del catálogo de retos por materia"""
+from app.catalogo import catalogo_retos
+
+def test_materia_desconocida_es_422_y_no_entra_en_la_cache(api, profesor):
+    respuesta = api.get("/retos/por-materia/alquimia", headers=profesor)
+
+    assert respuesta.status_code == 422
+    assert catalogo_retos.estadisticas()["entradas"] == 0
+
+def test_listado_por_materia_libera_el_lock_de_carga(api, profesor):
+    datos = {"titulo": "Verbos", "descripcion": "Conjuga", "nivel": "facil", "materia": "ingles"}
+    assert api.post("/retos/", json=datos, headers=profesor).status_code == 200
+
+    for _ in range(2):
+        respuesta = api.get("/retos/por-materia/ingles", headers=profesor)
+        assert respuesta.status_code == 200, respuesta.text
+        assert [reto["titulo"] for reto in respuesta.json()] == ["Verbos"]
+
+    assert catalogo_retos.estadisticas()["entradas"] == 1
+    assert catalogo_retos._cargas._locks == {}
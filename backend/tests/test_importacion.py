@@ -0,0 +1,47 @@
+from app import importacion
+from app.database import estadisticas_pool
+
+def _fila(dni, **campos):
+    return {
+        "dni": dni,
+        "nombre": "Ana",
+        "apellido": "Prueba",
+        "fecha_nacimiento": "2014-03-01",
+        "grado": "3",
+        "seccion": "A",
+        "sexo": "F",
+        "password": "clave",
+        **campos,
+    }
+
+def test_dni_numerico_es_error_de_fila_y_no_tumba_el_lote(api, profesor):
+    respuesta = api.post("/auth/crear-estudiantes", json=[_fila("1001"), _fila(12345), _fila("1002")], headers=profesor)
+
+    assert respuesta.status_code == 200, respuesta.text
+    cuerpo = respuesta.json()
+    assert (cuerpo["creados"], cuerpo["errores"]) == (2, 1)
+    erronea = cuerpo["resultados"][1]
+    assert erronea["estado"] == "error"
+    assert erronea["dni"] == "12345"
+    assert "dni" in erronea["error"]
+    assert [r["estado"] for r in cuerpo["resultados"]] == ["creado", "error", "creado"]
+
+def test_dni_repetido_en_el_lote_y_email_generado(api, profesor):
+    respuesta = api.post("/auth/crear-estudiantes", json=[_fila("2001"), _fila("2001")], headers=profesor)
+
+    resultados = respuesta.json()["resultados"]
+    assert resultados[0]["email"] == "2001@estudiante.colegio.edu"
+    assert resultados[1]["error"] == "El DNI está repetido en el listado"
+
+def test_no_retiene_conexion_mientras_hashea(api, profesor, monkeypatch):
+    en_uso = []
+
+    async def hash_falso(password, rounds):
+        en_uso.append(estadisticas_pool()["en_uso"])
+        return "hash"
+    monkeypatch.setattr(importacion, "hash_password", hash_falso)
+
+    respuesta = api.post("/auth/crear-estudiantes", json=[_fila("3001"), _fila("3002")], headers=profesor)
+
+    assert respuesta.json()["creados"] == 2
+    assert en_uso == [0, 0]
@@ -0,0 +1,71 @@
+"""Las consultas calientes usan índices, no recorren tablas completas, con un volumen realista"""
+import json
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from app.models.progreso_reto import ProgresoReto
+from app.models.reto import Reto, MateriaEnum
+from app.models.usuario import Usuario, RolEnum
+from app.ranking import CAMPOS_RANKING
+from tests.conftest import ejecutar_sql
+
+TABLAS_CALIENTES = {"usuarios", "retos", "progreso_retos"}
+
+@pytest.fixture(scope="module")
+def datos_sembrados(cliente):
+    ejecutar_sql(
+        "TRUNCATE usuarios, retos, progreso_retos RESTART IDENTITY CASCADE",
+        # 20 tenants x 1000 usuarios, 6 grados; 1 de cada 10 inactivo
+        """INSERT INTO usuarios (username, email, password_hash, rol, nombre, apellido, dni, grado, seccion,
+                                 puntos_matematicas, puntos_comunicacion, puntos_personal_social,
+                                 puntos_ciencia_tecnologia, puntos_ingles, puntos_totales, activo, tenant_id)
+           SELECT 'u' || i, 'u' || i || '@x.edu', 'h', 'ESTUDIANTE', 'N', 'A', 'd' || i, (i % 6)::text, 'A',
+                  i % 50, 0, 0, 0, 0, i % 50, i % 10 <> 0, 't' || (i % 20)
+           FROM generate_series(1, 20000) AS i""",
+        # 20 tenants x 250 retos; 1 de cada 5 inactivo
+        """INSERT INTO retos (titulo, descripcion, puntos, nivel, materia, profesor_id, activo, tenant_id)
+           SELECT 'r', 'd', 10, 'FACIL',
+                  (ARRAY['MATEMATICAS','COMUNICACION','PERSONAL_SOCIAL','CIENCIA_TECNOLOGIA','INGLES'])[1 + i % 5]::materiaenum,
+                  1 + i % 40, i % 5 <> 0, 't' || (i % 20)
+           FROM generate_series(1, 5000) AS i""",
+        """INSERT INTO progreso_retos (estudiante_id, reto_id, completado, puntos_obtenidos)
+           SELECT 1 + (i % 20000), 1 + (i / 20000) * 7 % 5000, true, 10
+           FROM generate_series(0, 99999) AS i
+           ON CONFLICT DO NOTHING""",
+        "ANALYZE usuarios, retos, progreso_retos",
+    )
+
+def _plan(consulta) -> dict:
+    sql = consulta.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    (explicacion,), = ejecutar_sql(f"EXPLAIN (FORMAT JSON) {sql}")
+    # asyncpg entrega el JSON ya decodificado o como texto según el códec registrado
+    if isinstance(explicacion, str):
+        explicacion = json.loads(explicacion)
+    return explicacion[0]["Plan"]
+
+def _recorridos_secuenciales(nodo: dict) -> set:
+    tablas = {nodo["Relation Name"]} if nodo["Node Type"] == "Seq Scan" else set()
+    for hijo in nodo.get("Plans", []):
+        tablas |= _recorridos_secuenciales(hijo)
+    return tablas
+
+CONSULTAS = {
+    # MotorRanking: carga en frío de un grado y del tenant completo
+    "ranking_grado": select(*[getattr(Usuario, campo) for campo in CAMPOS_RANKING]).where(
+        Usuario.rol == RolEnum.ESTUDIANTE, Usuario.tenant_id == "t3", Usuario.activo, Usuario.grado == "2"),
+    "ranking_tenant": select(*[getattr(Usuario, campo) for campo in CAMPOS_RANKING]).where(
+        Usuario.rol == RolEnum.ESTUDIANTE, Usuario.tenant_id == "t3", Usuario.activo),
+    # listar_retos, listar_retos_por_materia y mis_retos
+    "retos_tenant": select(Reto).where(Reto.activo, Reto.tenant_id == "t3"),
+    "retos_materia": select(Reto).where(Reto.activo, Reto.tenant_id == "t3", Reto.materia == MateriaEnum.INGLES),
+    "mis_retos": select(Reto).where(Reto.profesor_id == 7, Reto.activo),
+    # obtener_mi_progreso y el progreso de un reto concreto (completar)
+    "mi_progreso": select(ProgresoReto).where(ProgresoReto.estudiante_id == 1234),
+    "progreso_reto": select(ProgresoReto).where(ProgresoReto.estudiante_id == 1234, ProgresoReto.reto_id == 99),
+}
+
+@pytest.mark.parametrize("nombre", CONSULTAS)
+def test_consulta_caliente_sin_seq_scan(datos_sembrados, nombre):
+    plan = _plan(CONSULTAS[nombre])
+
+    assert not _recorridos_secuenciales(plan) & TABLAS_CALIENTES, json.dumps(plan, indent=1)
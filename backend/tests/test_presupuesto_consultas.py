@@ -0,0 +1,70 @@
+"""Presupuesto de consultas SQL de los endpoints calientes: un N+1 nuevo rompe estas pruebas"""
+import pytest
+from app.ranking import motor_ranking
+from tests.conftest import TENANT
+
+def _crear_reto(api, profesor, materia="matematicas") -> int:
+    datos = {"titulo": "Sumas", "descripcion": "Suma dos números", "puntos": 10,
+             "nivel": "facil", "materia": materia}
+    respuesta = api.post("/retos/", json=datos, headers=profesor)
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()["id"]
+
+@pytest.fixture
+def alumno(api, crear_usuario):
+    cabeceras = crear_usuario("alumno", "estudiante", grado="3", seccion="A")
+    # Calienta la caché de principales: el presupuesto mide el endpoint, no la autenticación
+    api.get("/retos/mi-progreso", headers=cabeceras)
+    return cabeceras
+
+def test_completar_reto(api, profesor, alumno, presupuesto_consultas):
+    reto_id = _crear_reto(api, profesor)
+
+    with presupuesto_consultas(1):
+        respuesta = api.post("/retos/completar", json={"reto_id": reto_id, "puntos_obtenidos": 10}, headers=alumno)
+
+    assert respuesta.status_code == 200, respuesta.text
+
+def test_completar_lote_no_crece_con_el_lote(api, profesor, alumno, presupuesto_consultas):
+    retos = [_crear_reto(api, profesor, materia) for materia in ("matematicas", "ingles", "comunicacion") * 5]
+    lote = [{"reto_id": reto_id, "puntos_obtenidos": 5} for reto_id in retos]
+
+    with presupuesto_consultas(3):
+        respuesta = api.post("/retos/completar-lote", json=lote, headers=alumno)
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.json()["completados"] == len(retos)
+
+def test_ranking(api, profesor, crear_usuario, presupuesto_consultas):
+    for i in range(10):
+        crear_usuario(f"alumno{i}", "estudiante", grado=str(i % 3))
+    api.get("/auth/ranking", headers=profesor)  # principal en caché
+    motor_ranking.descartar(TENANT)  # mide la carga en frío del ranking
+
+    with presupuesto_consultas(1):
+        respuesta = api.get("/auth/ranking", headers=profesor)
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert len(respuesta.json()) == 10
+
+def test_listar_retos(api, profesor, alumno, presupuesto_consultas):
+    for materia in ("matematicas", "ingles", "comunicacion") * 4:
+        _crear_reto(api, profesor, materia)
+
+    with presupuesto_consultas(1):
+        respuesta = api.get("/retos/", headers=alumno)
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert len(respuesta.json()) == 12
+
+def test_sync(api, profesor, alumno, presupuesto_consultas):
+    for materia in ("matematicas", "ingles"):
+        reto_id = _crear_reto(api, profesor, materia)
+        api.post("/retos/completar", json={"reto_id": reto_id, "puntos_obtenidos": 10}, headers=alumno)
+
+    with presupuesto_consultas(3):
+        respuesta = api.get("/sync", headers=alumno)
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert len(respuesta.json()["retos"]) == 2
+    assert len(respuesta.json()["progreso"]) == 2
@@ -0,0 +1,42 @@
+"""Ranking en memoria: estudiantes sin grado, vecinos incompletos y límites de la cache"""
+from app.ranking import motor_ranking
+from tests.conftest import TENANT
+
+def test_mi_ranking_sin_grado_es_404(api, crear_usuario):
+    alumno = crear_usuario("sin_grado", "estudiante")
+
+    respuesta = api.get("/auth/mi-ranking", headers=alumno)
+
+    assert respuesta.status_code == 404
+    assert "grado" in respuesta.json()["detail"]
+
+def test_mi_ranking_con_vecinos_sin_seccion(api, crear_usuario):
+    crear_usuario("ana", "estudiante", grado="3")
+    beto = crear_usuario("beto", "estudiante", grado="3", seccion="B")
+    crear_usuario("caro", "estudiante", grado="3")
+
+    respuesta = api.get("/auth/mi-ranking", headers=beto)
+
+    assert respuesta.status_code == 200, respuesta.text
+    general = respuesta.json()["general"]
+    assert general["total"] == 3
+    assert general["anterior"]["seccion"] is None or general["siguiente"]["seccion"] is None
+
+def test_ranking_del_tenant_incluye_estudiantes_sin_grado(api, profesor, crear_usuario):
+    crear_usuario("sin_grado", "estudiante")
+    crear_usuario("con_grado", "estudiante", grado="3", seccion="A")
+
+    respuesta = api.get("/auth/ranking", headers=profesor)
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert {fila["grado"] for fila in respuesta.json()} == {None, "3"}
+
+def test_grados_inventados_no_llenan_la_cache_del_ranking(api, profesor, crear_usuario):
+    crear_usuario("ana", "estudiante", grado="3")
+
+    for grado in ("3", "x1", "x2", "x3"):
+        respuesta = api.get("/auth/ranking", params={"grado": grado}, headers=profesor)
+        assert respuesta.status_code == 200, respuesta.text
+
+    assert motor_ranking._grupos.claves() == [(TENANT, "3")]
+    assert motor_ranking._cargas._locks == {}
@@ -0,0 +1,49 @@
+"""Subida de la foto de perfil: el límite de tamaño se aplica antes de leer el cuerpo"""
+import io
+import pytest
+from PIL import Image
+from app import imagenes
+from app.routers import usuarios
+from tests.conftest import ejecutar_sql
+
+def _png() -> bytes:
+    salida = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(salida, "PNG")
+    return salida.getvalue()
+
+@pytest.fixture
+def alumno_id(api, crear_usuario, tmp_path, monkeypatch):
+    monkeypatch.setattr(usuarios, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(imagenes, "UPLOAD_DIR", str(tmp_path))
+    crear_usuario("ana", "estudiante", grado="3")
+    (fila,) = ejecutar_sql("SELECT id FROM usuarios WHERE username = 'ana'")
+    return fila.id
+
+def test_subida_valida(api, alumno_id):
+    respuesta = api.post(f"/usuarios/{alumno_id}/profile-image", files={"file": ("foto.png", _png(), "image/png")})
+
+    assert respuesta.status_code == 200, respuesta.text
+    assert respuesta.json()["profile_image_url"].endswith(".png")
+
+def test_sin_content_length_es_411(api, alumno_id):
+    respuesta = api.post(
+        f"/usuarios/{alumno_id}/profile-image",
+        content=iter([b"--x\r\n", b"cuerpo sin longitud declarada"]),
+        headers={"Content-Type": "multipart/form-data; boundary=x"},
+    )
+
+    assert respuesta.status_code == 411
+
+def test_content_length_excesivo_es_413_sin_leer_el_cuerpo(api, alumno_id, monkeypatch, tmp_path):
+    monkeypatch.setattr(usuarios, "PROFILE_IMAGE_MAX_BYTES", 1024)
+
+    respuesta = api.post(f"/usuarios/{alumno_id}/profile-image",
+                         files={"file": ("foto.png", b"\x89PNG\r\n\x1a\n" + b"0" * 64 * 1024, "image/png")})
+
+    assert respuesta.status_code == 413
+    assert not any(tmp_path.iterdir())
+
+def test_formulario_sin_archivo_es_422(api, alumno_id):
+    respuesta = api.post(f"/usuarios/{alumno_id}/profile-image", data={"otro": "campo"})
+
+    assert respuesta.status_code == 422